@@ -0,0 +1,462 @@
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+import calendar
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from archiver_cache import cache_get, cache_put
+from archiver_stream import stream_archiver_data
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Default number of concurrent archiver queries
+
+MAX_WORKERS = 8
+
+# Longest query URL to send when requesting several channels at once
+
+MAX_URL_LENGTH = 2000
+
+# Parse archiver responses incrementally instead of all at once.  The
+# streamed values are always float64, so integer channels are written
+# to the .txt files as 1.0 rather than 1.
+
+STREAM = False
+
+def get_archiver_url(telNum):
+    '''
+    Returns the archiver API URL for the telescope from config.live.ini
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    '''
+
+    # K1ARCHIVER or K2ARCHIVER
+    api = f'K{telNum}ARCHIVER'
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config['API'][api]
+
+
+def get_max_workers():
+    '''
+    Returns the concurrency limit for archiver queries.  Can be set
+    with ARCHIVERWORKERS in the API section of config.live.ini.
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.getint('API', 'ARCHIVERWORKERS', fallback=MAX_WORKERS)
+
+
+def get_stream():
+    '''
+    Returns True if archiver responses are parsed incrementally.  Can be
+    set with ARCHIVERSTREAM in the API section of config.live.ini.
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.getboolean('API', 'ARCHIVERSTREAM', fallback=STREAM)
+
+
+def get_archiver_data(utDate, telNum, channel, archiveUrl='', useCache=True, stream=None):
+    '''
+    Uses the archiver API to retrieve JSON data for the
+    supplied channel. Returns a pandas data frame.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channel: string
+    @param channel: archiver PV name
+    @type archiveUrl: string
+    @param archiveUrl: archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver response incrementally (default is from config.live.ini)
+    '''
+
+    secs, vals = get_archiver_arrays(utDate, telNum, channel, archiveUrl, useCache, stream)
+    return archiver_frame(channel, secs, vals)
+
+
+def get_archiver_arrays(utDate, telNum, channel, archiveUrl='', useCache=True, stream=None):
+    '''
+    Uses the archiver API to retrieve JSON data for the
+    supplied channel. Returns (secs, vals) arrays.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channel: string
+    @param channel: archiver PV name
+    @type archiveUrl: string
+    @param archiveUrl: archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver response incrementally (default is from config.live.ini)
+    '''
+
+    if useCache:
+        cached = cache_get(telNum, channel, utDate)
+        if cached is not None:
+            return cached
+
+    if not archiveUrl:
+        archiveUrl = get_archiver_url(telNum)
+
+    data = query_archiver(archiveUrl, utDate, [channel], stream)
+    if channel in data:
+        secs, vals = data[channel]
+    else:
+        secs, vals = filter_archiver_data(utDate, channel, [])
+
+    if useCache:
+        cache_put(telNum, channel, utDate, secs, vals)
+
+    return secs, vals
+
+
+def get_archiver_data_multi(utDate, telNum, channels, archiveUrl='', useCache=True, stream=None):
+    '''
+    Uses the archiver API to retrieve JSON data for several channels
+    with as few queries as the URL length allows.  Returns a single
+    pandas data frame with timestamp and timeinsecs columns plus one
+    column per channel, aligned on time.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channels: list
+    @param channels: archiver PV names
+    @type archiveUrl: string
+    @param archiveUrl: archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver response incrementally (default is from config.live.ini)
+    '''
+
+    data = get_archiver_channels(utDate, telNum, channels, archiveUrl, useCache, stream)
+
+    wide = None
+    for channel in channels:
+        if channel not in data:
+            continue
+        d = data[channel].drop_duplicates(subset=['timeinsecs'], keep='last')
+        if wide is None:
+            wide = d
+        else:
+            wide = wide.merge(d, on=['timestamp', 'timeinsecs'], how='outer')
+
+    if wide is None:
+        return pd.DataFrame(columns=['timestamp', 'timeinsecs'])
+
+    wide = wide.sort_values('timeinsecs').reset_index(drop=True)
+    return wide
+
+
+def get_archiver_channels(utDate, telNum, channels, archiveUrl='', useCache=True, stream=None):
+    '''
+    Retrieves several channels with as few archiver queries as the URL
+    length allows.  Returns a dictionary of channel to the pandas data
+    frame get_archiver_data would return for it.  Channels missing from
+    the archiver response are not in the dictionary.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channels: list
+    @param channels: archiver PV names
+    @type archiveUrl: string
+    @param archiveUrl: archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver response incrementally (default is from config.live.ini)
+    '''
+
+    data = get_channel_arrays(utDate, telNum, channels, archiveUrl, useCache, stream)
+    return {channel: archiver_frame(channel, secs, vals) for channel, (secs, vals) in data.items()}
+
+
+def get_channel_arrays(utDate, telNum, channels, archiveUrl='', useCache=True, stream=None):
+    '''
+    Retrieves several channels with as few archiver queries as the URL
+    length allows.  Returns a dictionary of channel to (secs, vals)
+    arrays.  Channels missing from the archiver response are not in
+    the dictionary.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channels: list
+    @param channels: archiver PV names
+    @type archiveUrl: string
+    @param archiveUrl: archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver response incrementally (default is from config.live.ini)
+    '''
+
+    channels = list(dict.fromkeys(channels))
+
+    # Only query the channels that are not cached
+
+    newdata = {}
+    if useCache:
+        for channel in channels:
+            cached = cache_get(telNum, channel, utDate)
+            if cached is not None:
+                newdata[channel] = cached
+        channels = [channel for channel in channels if channel not in newdata]
+        if not channels:
+            return newdata
+
+    if not archiveUrl:
+        archiveUrl = get_archiver_url(telNum)
+
+    # Group channels so each query URL stays under the length limit
+
+    groups = []
+    length = len(query_url(archiveUrl, utDate, []))
+    for channel in channels:
+        pvLength = len(channel) + 4
+        if not groups or length + pvLength > MAX_URL_LENGTH:
+            groups.append([])
+            length = len(query_url(archiveUrl, utDate, []))
+        groups[-1].append(channel)
+        length += pvLength
+
+    data = {}
+    for group in groups:
+        data.update(query_archiver(archiveUrl, utDate, group, stream))
+
+    for channel in channels:
+        if channel in data:
+            secs, vals = data[channel]
+            if useCache:
+                cache_put(telNum, channel, utDate, secs, vals)
+            newdata[channel] = (secs, vals)
+
+    return newdata
+
+
+def query_url(archiveUrl, utDate, channels):
+    '''
+    Returns the archiver query URL for the channels on utDate
+    '''
+
+    # times for the query
+    start = f'{utDate}T00:00:00Z'
+    end   = f'{utDate}T23:59:59Z'
+
+    pvs = ''.join([f'pv={channel}&' for channel in channels])
+    return f'{archiveUrl}{pvs}from={start}&to={end}'
+
+
+def query_archiver(archiveUrl, utDate, channels, stream=None):
+    '''
+    Sends one archiver query and returns a dictionary of channel to the
+    (secs, vals) arrays kept for utDate
+    '''
+
+    start, end = utc_window(utDate)
+    if stream is None:
+        stream = get_stream()
+
+    # Retrieve data
+    with urlopen(query_url(archiveUrl, utDate, channels)) as response:
+        if stream:
+            data = stream_archiver_data(response, start, end, channels)
+        else:
+            data = response.read().decode('utf8')
+            data = json.loads(data)
+
+    if stream:
+        newdata = {}
+        for channel, (secs, vals) in data.items():
+            if 'acsTemp' in channel:
+                keep = ~(vals > 100)
+                secs, vals = secs[keep], vals[keep]
+            newdata[channel] = (secs, vals)
+        return newdata
+
+    samples = {}
+    for entry in data:
+        if len(channels) == 1:
+            name = channels[0]
+        else:
+            name = entry.get('meta', {}).get('name', '')
+        if name not in channels:
+            continue
+        samples.setdefault(name, [])
+        samples[name] += entry['data']
+
+    newdata = {}
+    for channel, s in samples.items():
+        newdata[channel] = filter_archiver_data(utDate, channel, s)
+
+    return newdata
+
+
+def utc_window(utDate):
+    '''
+    Returns the (start, end) epoch seconds of the part of utDate that
+    is kept from archiver data, 00:00 to 18:00 UT
+    '''
+
+    start = calendar.timegm(time.strptime(utDate, '%Y-%m-%d'))
+    return start, start + 18*3600
+
+
+def filter_archiver_data(utDate, channel, samples):
+    '''
+    Returns (secs, vals) arrays of the archiver samples for one channel,
+    keeping samples on utDate before 18:00 UT
+    '''
+
+    secs = np.array([d['secs'] for d in samples])
+    vals = np.array([d['val'] for d in samples])
+
+    # Keep utDate 00:00 to 18:00 UT and drop bad acsTemp values
+
+    start, end = utc_window(utDate)
+    keep = (secs >= start) & (secs < end)
+    if 'acsTemp' in channel:
+        keep &= ~(vals > 100)
+
+    return secs[keep], vals[keep]
+
+
+def archiver_frame(channel, secs, vals):
+    '''
+    Returns the pandas data frame for one channel from its filtered
+    (secs, vals) arrays
+    '''
+
+    newdata = {}
+    newdata['timestamp'] = pd.to_datetime(secs, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    newdata['timeinsecs'] = secs
+    newdata[channel] = vals
+
+    newdata = pd.DataFrame(data=newdata)
+    return newdata
+
+
+def fetch_archiver_data(utDate, queries, maxWorkers=0, log_writer='', archiveUrls=None, useCache=True, stream=None):
+    '''
+    Retrieves several archiver channels concurrently.  Channels for the
+    same telescope are batched into as few queries as possible.  Returns
+    a dictionary of (telNum, channel) to pandas data frame.  Channels
+    that could not be retrieved are not in the dictionary.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type queries: list
+    @param queries: list of (telNum, channel) to retrieve
+    @type maxWorkers: int
+    @param maxWorkers: maximum concurrent queries (default is from config.live.ini)
+    @type archiveUrls: dict
+    @param archiveUrls: telNum to archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver responses incrementally (default is from config.live.ini)
+    '''
+
+    data = fetch_archiver_arrays(utDate, queries, maxWorkers, log_writer, archiveUrls, useCache, stream)
+    return {key: archiver_frame(key[1], secs, vals) for key, (secs, vals) in data.items()}
+
+
+def fetch_archiver_arrays(utDate, queries, maxWorkers=0, log_writer='', archiveUrls=None, useCache=True, stream=None):
+    '''
+    Retrieves several archiver channels concurrently, as
+    fetch_archiver_data does.  Returns a dictionary of (telNum, channel)
+    to (secs, vals) arrays, without building data frames.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type queries: list
+    @param queries: list of (telNum, channel) to retrieve
+    @type maxWorkers: int
+    @param maxWorkers: maximum concurrent queries (default is from config.live.ini)
+    @type archiveUrls: dict
+    @param archiveUrls: telNum to archiver API URL (default is from config.live.ini)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type stream: bool
+    @param stream: parse the archiver responses incrementally (default is from config.live.ini)
+    '''
+
+    if not maxWorkers:
+        maxWorkers = get_max_workers()
+    if archiveUrls is None:
+        archiveUrls = {}
+
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        return {}
+
+    # One batched query per telescope
+
+    telescopes = {}
+    for telNum, channel in queries:
+        telescopes.setdefault(telNum, [])
+        telescopes[telNum].append(channel)
+
+    results = {}
+    retry = []
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(queries))) as pool:
+        futures = {}
+        for telNum, channels in telescopes.items():
+            url = archiveUrls.get(telNum, '')
+            futures[telNum] = pool.submit(get_channel_arrays, utDate, telNum, channels, url, useCache, stream)
+
+        for telNum, future in futures.items():
+            try:
+                for channel, data in future.result().items():
+                    results[(telNum, channel)] = data
+            except Exception as e:
+                if log_writer:
+                    log_writer.warning('archiver.py batched query failed for K{} ({}), querying channels individually'.format(telNum, e))
+                retry += [(telNum, channel) for channel in telescopes[telNum]]
+                continue
+
+            # Channels left out of the batched response
+
+            missing = [channel for channel in telescopes[telNum] if (telNum, channel) not in results]
+            if missing:
+                if log_writer:
+                    log_writer.warning('archiver.py batched query for K{} did not return {}, querying channels individually'.format(telNum, ', '.join(missing)))
+                retry += [(telNum, channel) for channel in missing]
+
+        # Fall back to one query per channel if a batch failed or was
+        # missing channels
+
+        futures = {}
+        for telNum, channel in retry:
+            url = archiveUrls.get(telNum, '')
+            futures[(telNum, channel)] = pool.submit(get_archiver_arrays, utDate, telNum, channel, url, useCache, stream)
+
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                if log_writer:
+                    log_writer.warning('archiver.py unable to read archiver data for {} ({})'.format(key[1], e))
+
+    return results
@@ -0,0 +1,175 @@
+import calendar
+import configparser
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Default cache location and size limit (MB)
+
+CACHE_DIR = dir_path + '/archiver_cache'
+CACHE_SIZE = 2000
+
+# Size of each cache directory in bytes, from one walk of the cache plus
+# the files this process has written since.  Files written by other
+# processes are counted when the estimate next goes over the limit and
+# the cache is walked again.
+
+cacheSizes = {}
+cacheLock = threading.Lock()
+
+def get_cache_config():
+    '''
+    Returns the (directory, size limit in bytes) of the archiver cache.
+    Can be set with ARCHIVERCACHEDIR and ARCHIVERCACHESIZE (MB) in the
+    API section of config.live.ini.
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    cacheDir = config.get('API', 'ARCHIVERCACHEDIR', fallback=CACHE_DIR)
+    cacheSize = config.getfloat('API', 'ARCHIVERCACHESIZE', fallback=CACHE_SIZE)
+    return cacheDir, int(cacheSize * 1000000)
+
+
+def cache_file(cacheDir, telNum, channel, utDate):
+    '''
+    Returns the cache file for the (telescope, channel, UT date)
+    '''
+
+    joinSeq = (cacheDir, '/k', str(telNum), '/', utDate.replace('-', ''), '/', quote(channel, safe=''), '.npz')
+    return ''.join(joinSeq)
+
+
+def is_complete(utDate):
+    '''
+    Returns True once the archiver data for utDate can no longer change
+    '''
+
+    end = calendar.timegm(time.strptime(utDate, '%Y-%m-%d')) + 86400
+    return time.time() > end + 3600
+
+
+def cache_get(telNum, channel, utDate, cacheDir=''):
+    '''
+    Returns the cached (secs, vals) arrays for the channel or None
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channel: string
+    @param channel: archiver PV name
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type cacheDir: string
+    @param cacheDir: cache directory (default is from config.live.ini)
+    '''
+
+    if not cacheDir:
+        cacheDir, cacheSize = get_cache_config()
+
+    file = cache_file(cacheDir, telNum, channel, utDate)
+    try:
+        with np.load(file) as data:
+            secs = data['secs']
+            vals = data['vals']
+    except (OSError, KeyError, ValueError):
+        return None
+
+    # Mark as recently used for eviction
+
+    try:
+        os.utime(file)
+    except OSError:
+        pass
+
+    return secs, vals
+
+
+def cache_put(telNum, channel, utDate, secs, vals, cacheDir='', cacheSize=0):
+    '''
+    Stores the (secs, vals) arrays for the channel if utDate is complete,
+    then evicts least recently used entries over the size limit
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channel: string
+    @param channel: archiver PV name
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type cacheDir: string
+    @param cacheDir: cache directory (default is from config.live.ini)
+    @type cacheSize: int
+    @param cacheSize: cache size limit in bytes (default is from config.live.ini)
+    '''
+
+    if not is_complete(utDate) or len(secs) == 0:
+        return
+
+    if not cacheDir or not cacheSize:
+        configDir, configSize = get_cache_config()
+        cacheDir = cacheDir or configDir
+        cacheSize = cacheSize or configSize
+
+    file = cache_file(cacheDir, telNum, channel, utDate)
+    try:
+        oldSize = os.path.getsize(file)
+    except OSError:
+        oldSize = 0
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez_compressed(fp, secs=secs, vals=vals)
+        size = os.path.getsize(tmpFile)
+        os.replace(tmpFile, file)
+    except OSError:
+        return
+
+    # Only walk the cache the first time and when it may be over the limit
+
+    with cacheLock:
+        totalSize = cacheSizes.get(cacheDir)
+        if totalSize is None or totalSize + size - oldSize > cacheSize:
+            cacheSizes[cacheDir] = evict(cacheDir, cacheSize)
+        else:
+            cacheSizes[cacheDir] = totalSize + size - oldSize
+
+
+def evict(cacheDir, cacheSize):
+    '''
+    Removes least recently used cache files until the cache is under
+    cacheSize bytes.  Returns the size of the cache left.
+    '''
+
+    entries = []
+    totalSize = 0
+    for root, dirs, files in os.walk(cacheDir):
+        for file in files:
+            if not file.endswith('.npz'):
+                continue
+            fullPath = os.path.join(root, file)
+            try:
+                st = os.stat(fullPath)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fullPath))
+            totalSize += st.st_size
+
+    if totalSize <= cacheSize:
+        return totalSize
+
+    entries.sort()
+    for mtime, size, fullPath in entries:
+        if totalSize <= cacheSize:
+            break
+        try:
+            os.remove(fullPath)
+        except OSError:
+            continue
+        totalSize -= size
+
+    return totalSize
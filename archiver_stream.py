@@ -0,0 +1,157 @@
+from array import array
+import codecs
+import json
+import numpy as np
+
+# Bytes read from the archiver response at a time
+
+CHUNK_SIZE = 65536
+
+class JsonStream:
+    '''
+    Incremental reader over a JSON byte stream.  Only the current chunk
+    and the value being decoded are held in memory.
+    '''
+
+    def __init__(self, fp, chunkSize=CHUNK_SIZE):
+        self.fp = fp
+        self.chunkSize = chunkSize
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        '''
+        Drops the consumed part of the buffer and reads the next chunk.
+        Returns False at the end of the stream.
+        '''
+
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        if self.eof:
+            return False
+
+        chunk = self.fp.read(self.chunkSize)
+        if not chunk:
+            self.buf += self.utf8.decode(b'', final=True)
+            self.eof = True
+            return False
+
+        self.buf += self.utf8.decode(chunk)
+        return True
+
+    def peek(self):
+        '''
+        Skips whitespace and returns the next character ('' at the end)
+        '''
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        '''
+        Consumes the next character, which must be char
+        '''
+
+        if self.peek() != char:
+            raise ValueError(f'archiver_stream.py expected {char!r} at offset {self.pos}')
+        self.pos += 1
+
+    def value(self):
+        '''
+        Decodes and returns the next complete JSON value
+        '''
+
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+
+                # A number at the end of the buffer may continue in the next chunk
+
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def stream_archiver_data(fp, start, end, channels):
+    '''
+    Parses an archiver JSON response incrementally, keeping samples with
+    start <= secs < end.  Returns a dictionary of channel to (secs, vals)
+    NumPy arrays.
+
+    @type fp: file
+    @param fp: archiver response opened for binary reading
+    @type start: int
+    @param start: first epoch second to keep
+    @type end: int
+    @param end: epoch second to stop at
+    @type channels: list
+    @param channels: PV names requested (used for entries without meta)
+    '''
+
+    js = JsonStream(fp)
+    samples = {}
+
+    js.expect('[')
+    if js.peek() == ']':
+        return {}
+
+    while True:
+
+        # One entry per PV, {"meta": {...}, "data": [...]}
+
+        name = channels[0] if len(channels) == 1 else ''
+        secs = array('q')
+        vals = array('d')
+
+        js.expect('{')
+        while js.peek() != '}':
+            key = js.value()
+            js.expect(':')
+            if key == 'data':
+                js.expect('[')
+                while js.peek() != ']':
+                    d = js.value()
+                    if start <= d['secs'] < end:
+                        secs.append(int(d['secs']))
+                        vals.append(d['val'])
+                    if js.peek() == ',':
+                        js.pos += 1
+                js.expect(']')
+            else:
+                val = js.value()
+                if key == 'meta' and len(channels) != 1:
+                    name = val.get('name', '')
+            if js.peek() == ',':
+                js.pos += 1
+        js.expect('}')
+
+        if name in samples:
+            samples[name][0].extend(secs)
+            samples[name][1].extend(vals)
+        elif name in channels:
+            samples[name] = (secs, vals)
+
+        if js.peek() == ',':
+            js.pos += 1
+            continue
+        js.expect(']')
+        break
+
+    newdata = {}
+    for name, (secs, vals) in samples.items():
+        newdata[name] = (np.frombuffer(secs, dtype=np.int64), np.frombuffer(vals, dtype=np.float64))
+
+    return newdata
@@ -0,0 +1,163 @@
+#---------------------------------------------------------------
+#
+# Rebuilds the nightly weather products for a range of UT dates.
+# Nights are run across a pool of worker processes, each of
+# which imports the plotting modules once.
+#
+# Usage: backfill.py wxDir YYYY-MM-DD YYYY-MM-DD [-processes N] [-nodb] [-nocache] [-notext]
+#
+# @param wxDir: output directory location
+# @type wxDir: string
+# @param YYYY-MM-DD: first and last UT date
+# @type YYYY-MM-DD: string
+# @param -processes N: number of worker processes (default is 4)
+# @param -nodb: do not update the koawx database table
+# @param -nocache: bypass the local archiver cache
+# @param -notext: only write the columnar archiver files, not the .txt dumps
+#
+# Each night logs to wxDir/weather_utDate.log as weather.py does.
+#
+#---------------------------------------------------------------
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from sys import argv
+import time
+import verification
+
+# Default number of worker processes
+
+PROCESSES = 4
+
+def init_worker():
+    '''
+    Imports weather and loads the plotting modules once per worker.
+    Nights already run in parallel so each renders its own plots.
+    '''
+
+    global weather
+    import weather
+    import plotting
+    import render_pool
+    plotting.get_hv()
+    render_pool.use_serial_pool()
+
+
+def run_night(wxDir, utDate, dbUpdate, useCache, writeText=True):
+    '''
+    Runs weather() for one night in a worker process.  Returns
+    (utDate, status, errors, seconds).
+    '''
+
+    start = time.time()
+    try:
+        errors = weather.weather(wxDir, utDate, dbUpdate, useCache, sendEmail=False, writeText=writeText)
+        status = 'ok' if errors == 0 else 'errors'
+    except Exception as e:
+        errors = 1
+        status = f'failed ({e})'
+    return utDate, status, errors, time.time() - start
+
+
+def date_range(startDate, endDate):
+    '''
+    Returns the list of UT dates (YYYY-MM-DD) from startDate to endDate
+    '''
+
+    start = datetime.strptime(startDate.replace('/', '-'), '%Y-%m-%d')
+    end = datetime.strptime(endDate.replace('/', '-'), '%Y-%m-%d')
+    dates = []
+    while start <= end:
+        dates.append(start.strftime('%Y-%m-%d'))
+        start += timedelta(days=1)
+    return dates
+
+
+def backfill(wxDir, startDate, endDate, processes=PROCESSES, dbUpdate=1, useCache=True, writeText=True):
+    '''
+    Runs weather() for each night from startDate to endDate and prints
+    a summary table.  Returns the list of (utDate, status, errors, seconds).
+
+    @type wxDir: string
+    @param wxDir: output directory location
+    @type startDate: string
+    @param startDate: first UT date (YYYY-MM-DD)
+    @type endDate: string
+    @param endDate: last UT date (YYYY-MM-DD)
+    @type processes: int
+    @param processes: number of worker processes
+    @type dbUpdate: int
+    @param dbUpdate: update the koawx database table (default is 1)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type writeText: bool
+    @param writeText: also write the .txt archiver files (default is True)
+    '''
+
+    verification.verify_date(startDate)
+    verification.verify_date(endDate)
+
+    dates = date_range(startDate, endDate)
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as pool:
+        futures = [pool.submit(run_night, wxDir, utDate, dbUpdate, useCache, writeText) for utDate in dates]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print('backfill.py {} {} ({:.1f} s)'.format(result[0], result[1], result[3]))
+
+    results.sort()
+    print_summary(results)
+    return results
+
+
+def print_summary(results):
+    '''
+    Prints a table of the backfill results
+    '''
+
+    print('')
+    print('{:<12}{:>8}{:>10}  {}'.format('UT Date', 'Errors', 'Seconds', 'Status'))
+    for utDate, status, errors, seconds in results:
+        print('{:<12}{:>8}{:>10.1f}  {}'.format(utDate, errors, seconds, status))
+
+    failed = len([r for r in results if r[2]])
+    print('')
+    print('{} nights, {} with errors'.format(len(results), failed))
+
+
+def main():
+    '''
+    Runs backfill() for the command line arguments
+    '''
+
+    usage = 'Usage: backfill.py wxDir YYYY-MM-DD YYYY-MM-DD [-processes N] [-nodb] [-nocache] [-notext]'
+    assert len(argv) >= 4, usage
+
+    wxDir = argv[1]
+    startDate = argv[2]
+    endDate = argv[3]
+    processes = PROCESSES
+    dbUpdate = 1
+    useCache = True
+    writeText = True
+
+    args = argv[4:]
+    while args:
+        arg = args.pop(0)
+        if arg == '-processes' and args and args[0].isdigit():
+            processes = int(args.pop(0))
+        elif arg == '-nocache':
+            useCache = False
+        elif arg == '-nodb':
+            dbUpdate = 0
+        elif arg == '-notext':
+            writeText = False
+        else:
+            assert False, 'Unknown argument {}\n{}'.format(arg, usage)
+
+    backfill(wxDir, startDate, endDate, processes, dbUpdate, useCache, writeText)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#---------------------------------------------------------------
+#
+# Nightly plots drawn with plain Bokeh, without HoloViews.  The
+# HTML written is the plot div and script only, the part fix_html
+# keeps, so the files need no post-processing.  NightPlots writes
+# all of a night's figures as one document with shared sources.
+#
+# Usage: bokeh_plots.py [samples]
+#
+# Benchmarks make_weather_plots and make_fwhm_plots with the
+# holoviews and bokeh backends on generated data.
+#
+#---------------------------------------------------------------
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Bokeh is imported by the functions that draw, like plotting.get_hv(),
+# so importing this module stays fast
+
+TOOLS = 'save,pan,wheel_zoom,box_zoom,reset'
+
+class SharedSources:
+    '''
+    Column data sources shared by the figures of a night.  Series with
+    the same sample times share one source (and one UT column) and a
+    channel plotted in several figures is stored once.  Values are
+    float32, serialized as base64 typed arrays.
+    '''
+
+    def __init__(self):
+        self.sources = {}
+
+    def get(self, secs, vals, channel):
+        '''
+        Returns the (source, column) holding the channel's values
+
+        @type secs: numpy array
+        @param secs: sample times in epoch seconds
+        @type vals: numpy array
+        @param vals: sample values
+        @type channel: string
+        @param channel: unique name of the series, e.g. the archiver channel
+        '''
+
+        from bokeh.models import ColumnDataSource
+
+        secs = np.asarray(secs, dtype=np.int64)
+        key = hashlib.sha1(secs.tobytes()).hexdigest()
+        if key not in self.sources:
+            self.sources[key] = ColumnDataSource(data={'UT': secs * 1000.0})
+        source = self.sources[key]
+        if channel not in source.data:
+            source.data[channel] = np.asarray(vals, dtype=np.float32)
+        return source, channel
+
+
+def series_source(secs, vals, sources, channel):
+    '''
+    Returns the (source, column) for one series, shared if sources is given
+    '''
+
+    from bokeh.models import ColumnDataSource
+
+    if sources is not None:
+        return sources.get(secs, vals, channel)
+    source = ColumnDataSource(data={
+        'UT': np.asarray(secs, dtype=np.int64) * 1000.0,
+        'value': np.asarray(vals, dtype=np.float64),
+    })
+    return source, 'value'
+
+
+def add_hover(fig, renderer, label, column):
+    '''
+    Adds a hover tool showing UT and the value for one renderer
+    '''
+
+    from bokeh.models import HoverTool
+
+    tooltips = [('UT', '@UT{%F %T}'), (label, '@{' + column + '}')]
+    fig.add_tools(HoverTool(renderers=[renderer], tooltips=tooltips, formatters={'@UT': 'datetime'}))
+
+
+def curve_figure(curves, yLabel, width=450, height=400, sources=None):
+    '''
+    Returns a Bokeh figure with one line per curve against UT
+
+    @type curves: list
+    @param curves: (secs, vals, label, color[, channel]) per line, secs in epoch seconds
+    @type yLabel: string
+    @param yLabel: y axis label
+    @type sources: SharedSources
+    @param sources: sources shared with other figures (default is one source per line)
+    '''
+
+    from bokeh.plotting import figure
+
+    fig = figure(width=width, height=height, x_axis_type='datetime', tools=TOOLS,
+                 x_axis_label='Universal Time', y_axis_label=yLabel)
+
+    for curve in curves:
+        secs, vals, label, color = curve[:4]
+        channel = curve[4] if len(curve) > 4 else label
+        source, column = series_source(secs, vals, sources, channel)
+        renderer = fig.line('UT', column, source=source, color=color, legend_label=label)
+        add_hover(fig, renderer, label, column)
+
+    fig.legend.click_policy = 'hide'
+    return fig
+
+
+def scatter_figure(series, yLabel, width=800, height=400, sources=None, size=6):
+    '''
+    Returns a Bokeh figure with one set of markers per series against UT
+
+    @type series: list
+    @param series: (secs, vals, label, color[, channel]) per set of markers
+    @type yLabel: string
+    @param yLabel: y axis label
+    '''
+
+    from bokeh.plotting import figure
+
+    fig = figure(width=width, height=height, x_axis_type='datetime', tools=TOOLS,
+                 x_axis_label='Universal Time', y_axis_label=yLabel)
+
+    for points in series:
+        secs, vals, label, color = points[:4]
+        channel = points[4] if len(points) > 4 else label
+        source, column = series_source(secs, vals, sources, channel)
+        renderer = fig.scatter('UT', column, source=source, color=color, size=size, legend_label=label)
+        add_hover(fig, renderer, label, column)
+
+    fig.legend.click_policy = 'hide'
+    return fig
+
+
+class NightPlots:
+    '''
+    Collects figures and writes them as one Bokeh document, name.json,
+    with the data sources shared between figures.  Each figure also gets
+    a small name.html fragment that embeds it from the document with
+    wxEmbed() from wx_plots.js, which the night's index.html loads once.
+
+    @type wxDir: string
+    @param wxDir: directory to write to
+    @type name: string
+    @param name: document file name without .json
+    '''
+
+    def __init__(self, wxDir, name='wx_plots'):
+        self.wxDir = wxDir
+        self.name = name
+        self.sources = SharedSources()
+        self.figures = []
+
+    def add_curves(self, plotName, curves, yLabel, width=450, height=400):
+        '''
+        Adds a line plot, written to plotName.html
+
+        @type curves: list
+        @param curves: (secs, vals, label, color, channel) per line
+        '''
+
+        self.figures.append((plotName, curve_figure(curves, yLabel, width, height, self.sources)))
+
+    def add_scatter(self, plotName, series, yLabel, width=800, height=400):
+        '''
+        Adds a scatter plot, written to plotName.html
+
+        @type series: list
+        @param series: (secs, vals, label, color, channel) per set of markers
+        '''
+
+        self.figures.append((plotName, scatter_figure(series, yLabel, width, height, self.sources)))
+
+    def save(self, log_writer=''):
+        '''
+        Writes the document and a fragment for each figure
+        '''
+
+        from bokeh.core.json_encoder import serialize_json
+        from bokeh.document import Document
+
+        if not self.figures:
+            return
+
+        doc = Document()
+        for plotName, fig in self.figures:
+            doc.add_root(fig)
+
+        # Bokeh 3 defers binary buffers unless asked to inline them
+
+        try:
+            docJson = doc.to_json(deferred=False)
+        except TypeError:
+            docJson = doc.to_json()
+        roots = {plotName: fig.id for plotName, fig in self.figures}
+        payload = serialize_json({'doc': docJson, 'roots': roots})
+
+        joinSeq = (self.wxDir, '/', self.name, '.json')
+        docFile = ''.join(joinSeq)
+        with open(docFile, 'w') as fp:
+            fp.write(payload)
+        if log_writer:
+            log_writer.info('bokeh_plots.py file saved {}'.format(docFile))
+
+        for plotName, fig in self.figures:
+            joinSeq = (self.wxDir, '/', plotName, '.html')
+            file = ''.join(joinSeq)
+            with open(file, 'w') as fp:
+                fp.write('<div id="{0}_plot"></div>\n'.format(plotName))
+                fp.write("<script>wxEmbed('{0}_plot', './{1}.json', '{0}');</script>\n".format(plotName, self.name))
+            if log_writer:
+                log_writer.info('bokeh_plots.py file saved {}'.format(file))
+
+
+def make_test_data(samples):
+    '''
+    Returns generated NightData for both telescopes with samples per
+    channel, as make_nightly_plots retrieves
+    '''
+
+    from make_nightly_plots import night_channels
+    from night_data import NightData
+
+    rng = np.random.default_rng(0)
+    secs = 1577836800 + np.arange(samples, dtype=np.int64) * (64800 // samples)
+    night = NightData('2020-01-01')
+    for i in range(1,3):
+        for name, channel in night_channels(i):
+            vals = np.cumsum(rng.normal(0, 0.1, samples)) + 10
+            night.add(i, name, channel, secs, vals)
+    return night
+
+
+def benchmark(samples):
+    '''
+    Times the nightly plots with each backend
+    '''
+
+    import make_nightly_plots as mn
+    from plotting import get_hv
+    import bokeh.plotting
+
+    # Load both plotting stacks first so only the rendering is timed
+
+    get_hv()
+    night = make_test_data(samples)
+    for backend in ('holoviews', 'bokeh'):
+        with tempfile.TemporaryDirectory() as wxDir:
+            for i in range(1,3):
+                os.makedirs(wxDir + '/nightly' + str(i))
+
+            start = time.time()
+            mn.make_weather_plots('2020-01-01', wxDir, night=night, writeText=False, backend=backend)
+            mn.make_fwhm_plots('2020-01-01', wxDir, night=night, writeText=False, backend=backend)
+            seconds = time.time() - start
+
+            files = [f for f in os.listdir(wxDir) if f.endswith('.html')]
+            size = sum(os.path.getsize(wxDir + '/' + f) for f in os.listdir(wxDir) if f.endswith(('.html', '.json')))
+            print('{:<10}{:>4} plots{:>8.2f} s{:>10.1f} MB'.format(backend, len(files), seconds, size / 1000000.0))
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,113 @@
+#---------------------------------------------------------------
+#
+# Compact in-memory archiver channel: int64 epoch seconds and
+# float64 values in NumPy arrays, converted to a pandas data frame
+# only when one is needed.
+#
+# Usage: channel_series.py [nights] [samples]
+#
+# Compares the memory used by nights of one channel held as the
+# data frames get_archiver_data returns and as ChannelSeries.
+#
+#---------------------------------------------------------------
+
+import sys
+import numpy as np
+
+class ChannelSeries:
+    '''
+    One archiver channel as typed arrays, 16 bytes per sample
+
+    @type channel: string
+    @param channel: archiver PV name
+    @type secs: numpy array
+    @param secs: sample times in epoch seconds, sorted
+    @type vals: numpy array
+    @param vals: sample values
+    '''
+
+    __slots__ = ('channel', 'secs', 'vals')
+
+    def __init__(self, channel, secs, vals):
+        self.channel = channel
+        self.secs = np.asarray(secs, dtype=np.int64)
+        self.vals = np.asarray(vals, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.secs)
+
+    def __repr__(self):
+        return 'ChannelSeries({!r}, {} samples)'.format(self.channel, len(self))
+
+    @property
+    def nbytes(self):
+        '''
+        Bytes held by the arrays
+        '''
+
+        return self.secs.nbytes + self.vals.nbytes
+
+    def between(self, start, end):
+        '''
+        Returns the samples from start up to end (epoch seconds) as a
+        ChannelSeries sharing this one's arrays
+        '''
+
+        lo, hi = np.searchsorted(self.secs, [start, end])
+        return ChannelSeries(self.channel, self.secs[lo:hi], self.vals[lo:hi])
+
+    def to_frame(self):
+        '''
+        Returns the data frame get_archiver_data returns, with
+        timestamp, timeinsecs and channel columns
+        '''
+
+        from archiver import archiver_frame
+        return archiver_frame(self.channel, self.secs, self.vals)
+
+    @classmethod
+    def concat(cls, series):
+        '''
+        Returns one ChannelSeries of several in time order, e.g. the
+        nights of a month or year
+
+        @type series: list
+        @param series: ChannelSeries of the same channel
+        '''
+
+        series = sorted([s for s in series if len(s)], key=lambda s: s.secs[0])
+        if not series:
+            return cls('', [], [])
+        secs = np.concatenate([s.secs for s in series])
+        vals = np.concatenate([s.vals for s in series])
+        return cls(series[0].channel, secs, vals)
+
+
+def benchmark(nights, samples):
+    '''
+    Prints the memory of nights of one channel as data frames and as
+    ChannelSeries
+    '''
+
+    from archiver import archiver_frame
+
+    rng = np.random.default_rng(0)
+    channel = 'k0:met:tempRaw'
+    frames = 0
+    series = []
+    for n in range(nights):
+        secs = 1577836800 + n * 86400 + np.arange(samples, dtype=np.int64) * (64800 // samples)
+        vals = np.cumsum(rng.normal(0, 0.1, samples)) + 10
+        data = archiver_frame(channel, secs, vals).rename(index=str, columns={channel: 'OutsideTemp'})
+        frames += int(data.memory_usage(deep=True).sum())
+        series.append(ChannelSeries(channel, secs, vals))
+    year = ChannelSeries.concat(series)
+
+    print('{:<14}{:>10} samples{:>10.1f} MB'.format('data frames', nights * samples, frames / 1000000.0))
+    print('{:<14}{:>10} samples{:>10.1f} MB'.format('ChannelSeries', len(year), year.nbytes / 1000000.0))
+
+
+if __name__ == '__main__':
+    nights = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+    benchmark(nights, samples)
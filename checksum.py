@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+
+# Bytes hashed at a time and number of files hashed at once
+
+CHUNK_SIZE = 1048576
+MAX_WORKERS = 4
+
+def md5_file(fullPath, chunkSize=CHUNK_SIZE):
+    '''
+    Returns the (md5 hex digest, size in bytes) of a file, read in chunks
+
+    @type fullPath: string
+    @param fullPath: file to hash
+    '''
+
+    md = hashlib.md5()
+    size = 0
+    with open(fullPath, 'rb') as fp:
+        while True:
+            chunk = fp.read(chunkSize)
+            if not chunk:
+                break
+            md.update(chunk)
+            size += len(chunk)
+    return md.hexdigest(), size
+
+
+def read_manifest(manifestFile):
+    '''
+    Returns the manifest written by the previous run as a dictionary of
+    path to [size, mtime_ns, md5], or an empty dictionary
+
+    @type manifestFile: string
+    @param manifestFile: manifest file
+    '''
+
+    try:
+        with open(manifestFile, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifestFile, manifest):
+    '''
+    Writes the manifest dictionary of path to [size, mtime_ns, md5]
+
+    @type manifestFile: string
+    @param manifestFile: manifest file
+    '''
+
+    tmpFile = manifestFile + '.tmp'
+    with open(tmpFile, 'w') as fp:
+        json.dump(manifest, fp)
+    os.replace(tmpFile, manifestFile)
+
+
+def md5sum(wxDir, md5sumFile, maxWorkers=MAX_WORKERS, manifestFile=''):
+    '''
+    Writes the md5sum of every file under wxDir to md5sumFile, hashing
+    files concurrently.  Returns (number of files, total size in MB).
+
+    If manifestFile is given, files whose size and modification time
+    match the previous run reuse the stored md5 and are not read.
+
+    @type wxDir: string
+    @param wxDir: directory to checksum
+    @type md5sumFile: string
+    @param md5sumFile: md5sum file to write (skipped when hashing)
+    @type maxWorkers: int
+    @param maxWorkers: number of files to hash at once
+    @type manifestFile: string
+    @param manifestFile: manifest from the previous run to update (default is none)
+    '''
+
+    oldManifest = read_manifest(manifestFile) if manifestFile else {}
+    manifest = {}
+
+    with open(md5sumFile, 'w') as fp:
+
+        # Walk through and list the files to hash
+
+        totalFiles = 0
+        fullPaths = []
+        for root, dirs, files in os.walk(wxDir):
+            totalFiles += len(files)
+            for file in files:
+                if file in md5sumFile:
+                    continue
+                joinSeq = (root, '/', file)
+                fullPaths.append(''.join(joinSeq))
+
+        # Reuse digests of unchanged files
+
+        stats = {}
+        toHash = []
+        for fullPath in fullPaths:
+            st = os.stat(fullPath)
+            stats[fullPath] = (st.st_size, st.st_mtime_ns)
+            entry = oldManifest.get(fullPath.replace(wxDir, '.'))
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                manifest[fullPath] = entry[2]
+            else:
+                toHash.append(fullPath)
+
+        # hashlib releases the GIL, so files hash in parallel on threads
+
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            for fullPath, (md, size) in zip(toHash, pool.map(md5_file, toHash)):
+                manifest[fullPath] = md
+
+        totalSize = 0
+        newManifest = {}
+        for fullPath in fullPaths:
+            md = manifest[fullPath]
+            size, mtime = stats[fullPath]
+            path = fullPath.replace(wxDir, '.')
+            joinSeq = (md, '  ', path, '\n')
+            fp.write(''.join(joinSeq))
+            totalSize += size / 1000000.0
+            newManifest[path] = [size, mtime, md]
+
+    if manifestFile:
+        write_manifest(manifestFile, newManifest)
+
+    return totalFiles, totalSize
@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import configparser
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Concurrent downloads, connections per host, seconds to wait for a
+# response and retries for connection errors and 5xx responses
+
+MAX_WORKERS = 8
+PER_HOST = 4
+TIMEOUT = 30
+RETRIES = 2
+CHUNK_SIZE = 65536
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+class HttpCache:
+    '''
+    Stores downloaded bodies with their ETag and Last-Modified
+    validators so a later download can be a conditional request
+
+    @type cacheDir: string
+    @param cacheDir: directory for cached bodies and validators
+    '''
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def files(self, url):
+        '''
+        Returns the (body, validators) cache files for url
+        '''
+
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        joinSeq = (self.cacheDir, '/', key)
+        base = ''.join(joinSeq)
+        return base + '.body', base + '.json'
+
+    def headers(self, url):
+        '''
+        Returns the conditional request headers for url
+        '''
+
+        body, meta = self.files(url)
+        if not os.path.exists(body):
+            return {}
+        try:
+            with open(meta, 'r') as fp:
+                validators = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last-modified'):
+            headers['If-Modified-Since'] = validators['last-modified']
+        return headers
+
+    def store(self, url, response, bodyFile):
+        '''
+        Stores a copy of a downloaded body if the response has validators
+        '''
+
+        validators = {}
+        for key in ('etag', 'last-modified'):
+            if response.headers.get(key):
+                validators[key] = response.headers[key]
+        if not validators:
+            return
+
+        # Unique temporary names, other processes may store the same URL
+
+        body, meta = self.files(url)
+        fd, tmpFile = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        os.close(fd)
+        try:
+            link_or_copy(bodyFile, tmpFile)
+            os.replace(tmpFile, body)
+        finally:
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+
+        fd, tmpFile = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(validators, fp)
+        os.replace(tmpFile, meta)
+
+    def restore(self, url, writeFile):
+        '''
+        Links or copies the cached body for url to writeFile
+        '''
+
+        body, meta = self.files(url)
+        link_or_copy(body, writeFile + '.part')
+        os.replace(writeFile + '.part', writeFile)
+
+
+def link_or_copy(src, dst):
+    '''
+    Hard links src to dst, copying if they are on different filesystems
+    '''
+
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def get_cache_dir():
+    '''
+    Returns the HTTP cache directory, HTTPCACHEDIR in the API section of
+    config.live.ini (default is ./http_cache)
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.get('API', 'HTTPCACHEDIR', fallback=dir_path+'/http_cache')
+
+
+class DownloadManager:
+    '''
+    Fetches URLs to files concurrently over a pooled requests.Session
+
+    @type maxWorkers: int
+    @param maxWorkers: maximum downloads at once
+    @type perHost: int
+    @param perHost: maximum connections to each host
+    @type timeout: float
+    @param timeout: seconds to wait for the server
+    @type retries: int
+    @param retries: retries for connection errors and 5xx responses
+    @type cache: HttpCache
+    @param cache: cache for conditional requests (default is none)
+    '''
+
+    def __init__(self, maxWorkers=MAX_WORKERS, perHost=PER_HOST, timeout=TIMEOUT, retries=RETRIES, cache=None):
+        self.maxWorkers = maxWorkers
+        self.perHost = perHost
+        self.timeout = timeout
+        self.cache = cache
+
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=perHost, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host_limit(self, url):
+        '''
+        Returns the semaphore limiting connections to the URL's host
+        '''
+
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.Semaphore(self.perHost)
+            return self.hosts[host]
+
+    def fetch(self, url, writeFile):
+        '''
+        Streams url to writeFile.  Returns '' on success or the error.
+        Nothing is written unless the server returns 200, or 304 for a
+        body held in the cache.
+
+        @type url: string
+        @param url: URL to retrieve
+        @type writeFile: string
+        @param writeFile: file to write to
+        '''
+
+        url = url.strip()
+        tmpFile = writeFile + '.part'
+        headers = self.cache.headers(url) if self.cache else {}
+        try:
+            with self.host_limit(url):
+                with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                    if response.status_code == 304 and headers:
+                        self.cache.restore(url, writeFile)
+                        return ''
+                    if response.status_code != 200:
+                        return f'HTTP {response.status_code}'
+                    with open(tmpFile, 'wb') as fp:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            fp.write(chunk)
+            os.replace(tmpFile, writeFile)
+        except (requests.RequestException, OSError) as e:
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+            return str(e)
+
+        # The download succeeded even if it could not be cached
+
+        if self.cache:
+            try:
+                self.cache.store(url, response, writeFile)
+            except OSError:
+                pass
+
+        return ''
+
+    def fetch_all(self, downloads):
+        '''
+        Fetches several URLs concurrently.  Returns a list of '' or the
+        error for each download, in order.
+
+        @type downloads: list
+        @param downloads: list of (url, writeFile)
+        '''
+
+        if not downloads:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(downloads))) as pool:
+            futures = [pool.submit(self.fetch, url, writeFile) for url, writeFile in downloads]
+            return [future.result() for future in futures]
+
+
+# Manager shared by all downloads in this process
+
+manager = None
+managerLock = threading.Lock()
+
+def get_manager():
+    '''
+    Returns the shared DownloadManager, creating it on first use
+    '''
+
+    global manager
+    with managerLock:
+        if manager is None:
+            manager = DownloadManager(cache=HttpCache(get_cache_dir()))
+    return manager
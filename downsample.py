@@ -0,0 +1,137 @@
+import configparser
+import os
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Default method and number of points per plotted channel (0 plots
+# every sample)
+
+METHOD = 'lttb'
+POINTS = 0
+
+def get_downsample_config():
+    '''
+    Returns the (method, points) used for the plots, PLOTDOWNSAMPLE
+    (lttb or minmax) and PLOTPOINTS in the API section of config.live.ini
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    method = config.get('API', 'PLOTDOWNSAMPLE', fallback=METHOD)
+    points = config.getint('API', 'PLOTPOINTS', fallback=POINTS)
+    return method, points
+
+
+def lttb(x, y, points):
+    '''
+    Returns the indices of the points kept by Largest-Triangle-Three-
+    Buckets.  The first and last points are kept and each bucket between
+    keeps the point forming the largest triangle with the point kept in
+    the previous bucket and the mean of the next bucket.
+
+    @type x: numpy array
+    @param x: sorted x values
+    @type y: numpy array
+    @param y: y values
+    @type points: int
+    @param points: number of points to keep
+    '''
+
+    count = len(x)
+    if points >= count or points < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket edges for the points between the first and last, and the
+    # mean of each bucket, the third point of the triangle
+
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    xMean = np.add.reduceat(x[1:count-1], edges[:-1] - 1) / sizes
+    yMean = np.add.reduceat(y[1:count-1], edges[:-1] - 1) / sizes
+    xMean = np.append(xMean, x[-1])
+    yMean = np.append(yMean, y[-1])
+
+    # Twice the triangle area is linear in the candidate point, so each
+    # bucket is one vectorized expression once the previous point is known
+
+    keep = np.empty(points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = count - 1
+    ax = x[0]
+    ay = y[0]
+    for i in range(points - 2):
+        lo = edges[i]
+        hi = edges[i + 1]
+        cx = xMean[i + 1]
+        cy = yMean[i + 1]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        keep[i + 1] = lo + np.argmax(area)
+        ax = x[keep[i + 1]]
+        ay = y[keep[i + 1]]
+
+    return keep
+
+
+def minmax(x, y, points):
+    '''
+    Returns the sorted indices of the minimum and maximum of each of
+    points/2 equal sized buckets, so every peak stays visible
+
+    @type x: numpy array
+    @param x: sorted x values
+    @type y: numpy array
+    @param y: y values
+    @type points: int
+    @param points: number of points to keep
+    '''
+
+    count = len(x)
+    if points >= count or points < 2:
+        return np.arange(count)
+
+    y = np.asarray(y, dtype=np.float64)
+    size = -(-count // (points // 2))
+    rows = -(-count // size)
+
+    # Pad to whole buckets with values that are never picked
+
+    low = np.full(rows * size, np.inf)
+    low[:count] = y
+    high = np.full(rows * size, -np.inf)
+    high[:count] = y
+
+    start = np.arange(rows) * size
+    keep = np.concatenate((start + low.reshape(rows, size).argmin(axis=1),
+                           start + high.reshape(rows, size).argmax(axis=1)))
+    return np.unique(keep)
+
+
+def downsample_arrays(secs, vals, points, method=METHOD):
+    '''
+    Returns the (secs, vals) samples kept for plotting, or the arrays
+    themselves if points is 0 or not below the number of samples
+
+    @type secs: numpy array
+    @param secs: sorted epoch seconds
+    @type vals: numpy array
+    @param vals: float64 values
+    @type points: int
+    @param points: number of points to keep (0 keeps all)
+    @type method: string
+    @param method: lttb or minmax
+    '''
+
+    if not points or points >= len(secs):
+        return secs, vals
+
+    if method == 'minmax':
+        keep = minmax(secs, vals, points)
+    else:
+        keep = lttb(secs, vals, points)
+
+    return secs[keep], vals[keep]
+
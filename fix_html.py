@@ -1,5 +1,20 @@
+import io
 import os
 
+def data_section(data):
+    """
+    Returns the index of the line starting the Bokeh data section,
+    or 0 if not found.
+    """
+
+    dataString = '<div class="bk-root"'
+    for key, line in enumerate(data):
+        if dataString in line:
+            return key
+
+    return 0
+
+
 def fix_html(file, log_writer=''):
     """
     Remove Bokey header from HTML file.
@@ -15,13 +30,7 @@ def fix_html(file, log_writer=''):
     with open(file, 'r') as fp:
         data = fp.read().splitlines(True)
 
-    dataString = '<div class="bk-root"'
-    num = holo = 0
-    for key, line in enumerate(data):
-        if num == 0 and dataString in line:
-            num = key
-        if holo == 0 and 'HoloViewsWidget' in line:
-            holo = key
+    num = data_section(data)
 
     if num == 0:
         if log_writer:
@@ -42,3 +51,34 @@ def fix_html(file, log_writer=''):
 #                fp2.writelines(data[holo:num])
 #            if log_writer:
 #                log_writer.info('fix_html.py header.js created in {}'.format(outDir))
+
+
+def save_html(renderer, obj, file, log_writer=''):
+    """
+    Renders obj with the HoloViews renderer and writes file.html once,
+    already trimmed.  Gives the same file as renderer.save(obj, file)
+    followed by fix_html(file + '.html').  Returns True if the header
+    was removed.
+    """
+
+    # Render in memory and read it back as fix_html reads the file
+
+    buf = io.BytesIO()
+    renderer.save(obj, buf, title=os.path.basename(file))
+    html = buf.getvalue()
+    data = io.TextIOWrapper(io.BytesIO(html)).read().splitlines(True)
+
+    num = data_section(data)
+
+    if num == 0:
+        with open(file + '.html', 'wb') as fp:
+            fp.write(html)
+        if log_writer:
+            log_writer.info('fix_html.py data section not found')
+    else:
+        with open(file + '.html', 'w') as fp:
+            fp.writelines(data[num:])
+        if log_writer:
+            log_writer.info('fix_html.py file header updated')
+
+    return num != 0
@@ -1,14 +1,15 @@
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
 import re
 import os
 import verification
-import urllib.request
 import update_wx_db as wxdb
-import pandas as pd
-from fix_html import fix_html
-import holoviews as hv
-hv.extension('bokeh')
+from download import get_manager
+from mkwc import read_mkwc_dat
+from fix_html import save_html
+from plotting import get_hv, get_backend
+from render_pool import get_pool
+import bokeh_plots
+import numpy as np
 
 def get_dimm_data(utDate='', mdir='.', log_writer=''):
     '''
@@ -63,65 +64,59 @@ def get_dimm_data(utDate='', mdir='.', log_writer=''):
 
         url = 'http://mkwc.ifa.hawaii.edu/current/seeing'
 
-        # Get data
+        # JPG plots
 
-        for f in files:
+        plots = {
+        'CFHT Weather Tower Seeing':'http://hokukea.soest.hawaii.edu/current/seeing/images/YYYYMMDD.wrf-vs-mkam.timeseries.jpg',
+        'CFHT MASS Profile':' http://hokukea.soest.hawaii.edu/current/seeing/images/YYYYMMDD.massprofile.jpg',
+        'CFHT DIMM Seeing Histogram':'http://hokukea.soest.hawaii.edu/current/seeing/analysis/images/dimmdailyhistogram.jpg',
+        'CFHT MASS Seeing Histogram':'http://hokukea.soest.hawaii.edu/current/seeing/analysis/images/massdailyhistogram.jpg'
+        }
 
-            # Construct URL
+        # Construct URLs and files to write to
 
+        downloads = []
+        for f in files:
             joinSeq = (url, '/', f, '/', utDate, '.', f, '.dat')
             newUrl = ''.join(joinSeq)
-
-            if log_writer:
+            joinSeq = (mdir, '/', utDate, '.mkwc.', f, '.dat')
+            writeFile = ''.join(joinSeq)
+            downloads.append((newUrl, writeFile))
+
+        for key, plotUrl in plots.items():
+            plotUrl = plotUrl.replace('YYYYMMDD', utDate).strip()
+            f = os.path.basename(plotUrl)
+            if 'analysis' in plotUrl:
+                joinSeq = (year, month, day, '.', f)
+                f = ''.join(joinSeq)
+            joinSeq = (mdir, '/', f)
+            writeFile = ''.join(joinSeq)
+            downloads.append((plotUrl, writeFile))
+
+        # Get data and plots concurrently
+
+        nData = len(files)
+        if log_writer:
+            for newUrl, writeFile in downloads[:nData]:
                 log_writer.info('get_dimm_data.py retrieving data from {}'.format(newUrl))
+            for plotUrl, writeFile in downloads[nData:]:
+                log_writer.info('get_dimm_data.py retrieving {}'.format(plotUrl))
+        errors = get_manager().fetch_all(downloads)
 
-            # Connect to URL
-
-            response = requests.get(newUrl)
-
-            # If page exists, then get data
-
-            if response.status_code == 200:
-
-                # Construct file to write to
-
-                joinSeq = (mdir, '/', utDate, '.mkwc.', f, '.dat')
-                writeFile = ''.join(joinSeq)
-
-                # Write data to file
-
-                with open(writeFile, 'w') as fp2:
-                    fp2.write(response.text)
+        for (newUrl, writeFile), error, f in zip(downloads[:nData], errors[:nData], files):
+            if not error:
                 fp.write('<a href="./'+os.path.basename(writeFile)+'">'+os.path.basename(writeFile)+'<p>\n')
             else:
                 if log_writer:
                     log_writer.error('get_dimm_data.py no {} data for {}'.format(f, utDate))
 
-        # Get JPG plots
-
-        plots = {
-        'CFHT Weather Tower Seeing':'http://hokukea.soest.hawaii.edu/current/seeing/images/YYYYMMDD.wrf-vs-mkam.timeseries.jpg',
-        'CFHT MASS Profile':' http://hokukea.soest.hawaii.edu/current/seeing/images/YYYYMMDD.massprofile.jpg',
-        'CFHT DIMM Seeing Histogram':'http://hokukea.soest.hawaii.edu/current/seeing/analysis/images/dimmdailyhistogram.jpg',
-        'CFHT MASS Seeing Histogram':'http://hokukea.soest.hawaii.edu/current/seeing/analysis/images/massdailyhistogram.jpg'
-        }
-
-        for key, url in plots.items():
-            url = url.replace('YYYYMMDD', utDate)
-            if log_writer:
-                log_writer.info('get_dimm_data.py retrieving {}'.format(url))
-            try:
-                f = os.path.basename(url)
-                if 'analysis' in url:
-                    joinSeq = (year, month, day, '.', f)
-                    f = ''.join(joinSeq)
-                joinSeq = (mdir, '/', f)
-                writeFile = ''.join(joinSeq)
-                urllib.request.urlretrieve(url, writeFile)
+        for (plotUrl, writeFile), error in zip(downloads[nData:], errors[nData:]):
+            f = os.path.basename(writeFile)
+            if not error:
                 fp.write('<a href="./'+f+'"><img src="'+f+'" width="750" title="'+f+'"><p>\n')
-            except:
+            else:
                 if log_writer:
-                    log_writer.error('get_dimm_data.py url does not exist - {}'.format(url))
+                    log_writer.error('get_dimm_data.py url does not exist - {}'.format(plotUrl))
                 sendUrl = ''.join(('cmd=updateWxDb&utdate=', dbDate, '&column=cfht_seeing&value=ERROR'))
                 wxdb.updateWxDb(sendUrl, log_writer)
 
@@ -130,7 +125,7 @@ def get_dimm_data(utDate='', mdir='.', log_writer=''):
 
     # Create bokeh plot 
 
-    create_bokeh_plot(utDate, mdir)
+    create_bokeh_plot(utDate, mdir, log_writer=log_writer)
 
     if log_writer:
         log_writer.info('get_dimm_data.py complete for {}'.format(utDate))
@@ -144,47 +139,50 @@ def get_dimm_data(utDate='', mdir='.', log_writer=''):
             with open(writeFile, 'w') as fp2:
                 fp2.write('No Data')
 
-def create_bokeh_plot(utDate, mdir):
+def create_bokeh_plot(utDate, mdir, backend='', log_writer=''):
     """ Creates Bokeh plot of mass/dimm data """
 
 #    files = {'dimm', 'mass', 'masspro'}
     files = {'dimm', 'mass'}
 
-    renderer = hv.renderer('bokeh')
-
-    # Column name for first 7 columns of each file
-    keyNames = [0, 1, 2, 3, 4, 5, 6]
-    colNames = ['year', 'month', 'day', 'hour', 'minute', 'second']
-
-    # Set hover and point size
-    curve_opts = dict(tools=['hover'], size=6)
+    if not backend:
+        backend = get_backend()
+    if backend == 'bokeh':
+        create_seeing_plot(utDate, mdir, sorted(files), log_writer)
+        return
 
-    # Create a combined plot of all data
-    plot = None
+    # Read each file and render the combined plot in a render worker
+    frames = []
     for f in files:
         joinSeq = (mdir, '/', utDate, '.mkwc.', f, '.dat')
         fileName = ''.join((joinSeq))
 
         if not os.path.exists(fileName): continue
 
-        # Update keys to add seeing column and others for masspro data
-        keys = keyNames.copy()
-        names = colNames.copy()
-        if 'masspro' in f:
-            keys += [7, 8, 9, 10, 11, 12]
-            names += ['a', 'b', 'c', 'd', 'e', 'f']
-        names.append('seeing')
-
-        # Read the data and assign column names
-        data = pd.read_csv(fileName, header=None, delimiter=' ', dtype=str)
-        keysRename = dict(zip(keys, names))
-        data = data.rename(index=str, columns=keysRename)
-
-        # Set date column
-        dateCol = pd.to_datetime(data['year']+data['month']+data['day']+' '+data['hour']+data['minute']+data['second'], format='%Y%m%d %H:%M:%S')
-        dateCol += timedelta(hours=10)
-        data = data.assign(date=dateCol)
-        data['seeing'] = pd.to_numeric(data['seeing'])
+        # Read the data with typed columns and a UT date column
+        frames.append((f, read_mkwc_dat(fileName, f, log_writer)[['date', 'seeing']]))
+
+    # Save HTML if plot exits
+    if frames:
+        plot_opts = dict(height=400, width=800)
+        joinSeq = (mdir, '/massdimm_plot')
+        outFile = ''.join((joinSeq))
+        get_pool().submit(render_seeing_plot, outFile, frames, plot_opts).result()
+    else: print('No plot created')
+
+
+def render_seeing_plot(outFile, frames, plot_opts):
+    """ Renders the mass/dimm plot to outFile.html, run in a render worker """
+
+    hv = get_hv()
+    renderer = hv.renderer('bokeh')
+
+    # Set hover and point size
+    curve_opts = dict(tools=['hover'], size=6)
+
+    # Create a combined plot of all data
+    plot = None
+    for f, data in frames:
 
         # Create this scatter plot
         p = hv.Scatter(data, 'date', 'seeing', label=f.upper())
@@ -198,11 +196,29 @@ def create_bokeh_plot(utDate, mdir):
             p = p.redim.label(seeing='Seeing')
             plot = p
 
-    # Save HTML if plot exits
-    if plot:
-        plot_opts = dict(height=400, width=800)
-        joinSeq = (mdir, '/massdimm_plot')
-        outFile = ''.join((joinSeq))
-        renderer.save(plot.options(**plot_opts), outFile)
-        fix_html(outFile + '.html')
-    else: print('No plot created')
+    return save_html(renderer, plot.options(**plot_opts), outFile)
+
+
+def create_seeing_plot(utDate, mdir, files, log_writer=''):
+    """ Creates the mass/dimm plot with plain Bokeh (see bokeh_plots.py) """
+
+    colors = {'dimm': '#30a2da', 'mass': '#fc4f30', 'masspro': '#e5ae38'}
+
+    series = []
+    for f in files:
+        joinSeq = (mdir, '/', utDate, '.mkwc.', f, '.dat')
+        fileName = ''.join((joinSeq))
+
+        if not os.path.exists(fileName): continue
+
+        data = read_mkwc_dat(fileName, f, log_writer)
+        secs = data['date'].values.astype('datetime64[s]').astype(np.int64)
+        series.append((secs, data['seeing'].values, f.upper(), colors[f], f))
+
+    if not series:
+        print('No plot created')
+        return
+
+    plots = bokeh_plots.NightPlots(mdir, 'massdimm_plots')
+    plots.add_scatter('massdimm_plot', series, 'Seeing', width=800, height=400)
+    plots.save()
@@ -0,0 +1,92 @@
+#---------------------------------------------------------------
+#
+# Reports the import (startup) time of the weather modules.
+#
+# Usage: import_report.py [module ...] [-top N] [-target seconds]
+#
+# Each module (default is weather) is imported in a fresh
+# interpreter with -X importtime.  The wall time and the slowest
+# top-level packages are printed.  Exits with status 1 if a module
+# takes longer than the target (default is 1 second).
+#
+#---------------------------------------------------------------
+
+import os
+import subprocess
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Default modules to report and startup target (seconds)
+
+MODULES = ['weather']
+TARGET = 1.0
+
+def import_times(module):
+    '''
+    Imports module in a new interpreter.  Returns (wall seconds,
+    dictionary of top-level package to cumulative seconds).
+
+    @type module: string
+    @param module: module to import
+    '''
+
+    code = ''.join(('import time; t = time.perf_counter(); import ', module, '; print(time.perf_counter() - t)'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=dir_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # Lines are "import time: self | cumulative | name", nesting shown
+    # by indenting the name.  Keep the slowest import of each top-level
+    # package other than the module itself.
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        package = fields[2].strip().split('.')[0]
+        seconds = int(fields[1]) / 1000000.0
+        if package != module and seconds > packages.get(package, 0):
+            packages[package] = seconds
+
+    return float(result.stdout.strip().splitlines()[-1]), packages
+
+
+def report(modules=MODULES, top=10, target=TARGET):
+    '''
+    Prints the import time of each module.  Returns True if all are
+    within target seconds.
+    '''
+
+    ok = True
+    for module in modules:
+        wall, packages = import_times(module)
+        status = 'ok' if wall <= target else 'SLOW'
+        if wall > target:
+            ok = False
+        print('{}  {:.3f} s  ({}, target {:.1f} s)'.format(module, wall, status, target))
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+        for package, seconds in slowest[:top]:
+            print('    {:<24}{:>8.3f} s'.format(package, seconds))
+
+    return ok
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    top = 10
+    target = TARGET
+    if '-top' in args:
+        i = args.index('-top')
+        top = int(args[i+1])
+        del args[i:i+2]
+    if '-target' in args:
+        i = args.index('-target')
+        target = float(args[i+1])
+        del args[i:i+2]
+
+    sys.exit(0 if report(args or MODULES, top, target) else 1)
@@ -1,43 +1,149 @@
-import configparser
-from urllib.request import urlopen
-import json
-import time
 from datetime import datetime, timedelta
 import os
-import pandas as pd
-import numpy as np
-from fix_html import fix_html
-import holoviews as hv
-hv.extension('bokeh')
-
-def make_nightly_plots(utDate, wxDir, log_writer=''):
+from fix_html import save_html
+from night_data import NightData
+from night_archive import write_night_archive
+from concurrent.futures.process import BrokenProcessPool
+from plotting import get_hv, get_backend
+from render_pool import get_pool, reset_pool
+import bokeh_plots
+from downsample import get_downsample_config
+
+def make_nightly_plots(utDate, wxDir, log_writer='', useCache=True, writeText=True, backend=''):
     '''
     Create plots of nightly weather and FWHM data
 
     @type wxDir: string
     @param wxDir: directory to nightly data
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type writeText: bool
+    @param writeText: also write each channel to a .txt file (default is True)
+    @type backend: string
+    @param backend: holoviews or bokeh (default is from config.live.ini)
     '''
 
+    if not backend:
+        backend = get_backend()
+    method, points = get_downsample_config()
+
     if not wxDir or not os.path.exists(wxDir):
         if log_writer:
             log_writer.error('make_nightly_plots.py wxDir does not exist - {}'.format(wxDir))
         return
 
+    # Query all channels for both telescopes at once
+
+    channels = {i: night_channels(i) for i in range(1,3)}
+
+    if log_writer:
+        count = sum([len(c) for c in channels.values()])
+        log_writer.info('make_nightly_plots.py retrieving {} archiver channels'.format(count))
+    night = NightData.fetch(utDate, channels, log_writer, useCache)
+
+    # One typed columnar file per telescope with every channel
+
+    for i in range(1,3):
+        write_night_archive(wxDir, i, night.archive_channels(i), log_writer)
+
+    # Bokeh figures of both functions are written as one document and
+    # HoloViews plots of both render together in the render pool
+
+    plots = bokeh_plots.NightPlots(wxDir) if backend == 'bokeh' else None
+    jobs = []
+
     if log_writer:
         log_writer.info('make_nightly_plots.py calling make_weather_plots')
-    make_weather_plots(utDate, wxDir, log_writer)
+    make_weather_plots(utDate, wxDir, log_writer, night, writeText, backend, points, method, plots, jobs)
 
     if log_writer:
         log_writer.info('make_nightly_plots.py calling make_fwhm_plots')
-    make_fwhm_plots(utDate, wxDir, log_writer)
+    make_fwhm_plots(utDate, wxDir, log_writer, night, writeText, backend, points, method, plots, jobs)
+
+    if plots:
+        plots.save(log_writer)
+    gather_plots(jobs, log_writer)
 
 
-def make_weather_plots(utDate, wxDir, log_writer=''):
+def weather_channels(telNum):
+    '''
+    Returns the archiver channels and column names for the weather plots
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    '''
+
+    keys = []
+    keys.append('k0:met:tempRaw')
+    keys.append(f'k{telNum}:met:tempRaw')
+    keys.append(f'k{telNum}:dcs:sec:acsTemp')
+    keys.append(f'k{telNum}:dcs:sec:secondaryTemp')
+    keys.append('k0:met:humidityRaw')
+    keys.append(f'k{telNum}:met:humidityRaw')
+    keys.append('k0:met:pressureRaw')
+    keys.append('k0:met:dewpointRaw')
+
+    # Set column header - used to swap from channel strings
+
+    names = []
+    names.append('OutsideTemp')
+    names.append('InsideTemp')
+    names.append('PrimaryTemp')
+    names.append('SecondaryTemp')
+    names.append('OutsideHumidity')
+    names.append('InsideHumidity')
+    names.append('Pressure')
+    names.append('Dewpoint')
+
+    return keys, names
+
+
+def fwhm_channel(telNum):
+    '''
+    Returns the archiver channel for the FWHM plot
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    '''
+
+    return f'k{telNum}:dcs:pnt:cam0:fwhm'
+
+
+def night_channels(telNum):
+    '''
+    Returns the (name, archiver channel) pairs retrieved for the night,
+    the weather channels and fwhm
+
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    '''
+
+    keys, names = weather_channels(telNum)
+    channels = list(zip(names, keys))
+    channels.append(('fwhm', fwhm_channel(telNum)))
+    return channels
+
+
+def make_weather_plots(utDate, wxDir, log_writer='', night=None, writeText=True, backend='holoviews', points=0, method='lttb', plots=None, jobs=None):
     '''
     Create plots of nightly weather from envMet.arT
 
     @type wxDir: string
     @param wxDir: directory to nightly data
+    @type night: NightData
+    @param night: the night's archiver data (default is to query the archiver)
+    @type writeText: bool
+    @param writeText: write each channel to a .txt file (default is True)
+    @type backend: string
+    @param backend: holoviews (default) or bokeh
+    @type points: int
+    @param points: points plotted per channel (default is 0, all samples)
+    @type method: string
+    @param method: downsampling method, lttb (default) or minmax
+    @type plots: NightPlots
+    @param plots: collects the bokeh figures (default is to write wx_weather.json)
+    @type jobs: list
+    @param jobs: collects the (file, future) render jobs (default is to wait for them)
     '''
 
     split = utDate.split('-')
@@ -45,6 +151,22 @@ def make_weather_plots(utDate, wxDir, log_writer=''):
     month = split[1]
     day = split[2]
 
+    savePlots = backend == 'bokeh' and plots is None
+    waitJobs = jobs is None
+    if waitJobs:
+        jobs = []
+    if savePlots:
+        plots = bokeh_plots.NightPlots(wxDir, 'wx_weather')
+
+    # Query archive
+
+    if night is None:
+        channels = {}
+        for i in range(1,3):
+            keys, names = weather_channels(i)
+            channels[i] = list(zip(names, keys))
+        night = NightData.fetch(utDate, channels, log_writer)
+
     # For each nightly directory
 
     for i in range(1,3):
@@ -58,107 +180,81 @@ def make_weather_plots(utDate, wxDir, log_writer=''):
 #            if log_writer:
 #                log_writer.error('make_nightly_plots.py file does not exist - {}'.format(file))
 
-        # Query archive
-
-        keys = []
-        keys.append('k0:met:tempRaw')
-        keys.append(f'k{i}:met:tempRaw')
-        keys.append(f'k{i}:dcs:sec:acsTemp')
-        keys.append(f'k{i}:dcs:sec:secondaryTemp')
-        keys.append('k0:met:humidityRaw')
-        keys.append(f'k{i}:met:humidityRaw')
-        keys.append('k0:met:pressureRaw')
-        keys.append('k0:met:dewpointRaw')
-
-        # Set column header - used to swap from channel strings
-
-        names = []
-        names.append('OutsideTemp')
-        names.append('InsideTemp')
-        names.append('PrimaryTemp')
-        names.append('SecondaryTemp')
-        names.append('OutsideHumidity')
-        names.append('InsideHumidity')
-        names.append('Pressure')
-        names.append('Dewpoint')
-        
-        data = []
-        for key, channel in enumerate(keys):
-            try:
-                archData = get_archiver_data(utDate, i, channel)
-                data.append(archData)
-                joinSeq = (wxDir, '/nightly', str(i), '/k', str(i), '_', names[key], '.txt')
-                file = ''.join(joinSeq)
-                archData.to_csv(file, sep='\t')
-            except:
+        # Full resolution text files
+
+        keys, names = weather_channels(i)
+        for name in names:
+            if not night.has(i, name):
                 if log_writer:
                     log_writer.error('make_fwhm_plots.py unable read archiver data')
                 continue
-
-        # Format time data
-
-        keysRename = dict(zip(keys, names))
-     
-        for key, d in enumerate(data):
-            data[key]['UT'] = pd.to_datetime(d['timestamp'], format='%Y-%m-%d %H:%M:%S')
-            data[key] = d.rename(index=str, columns=keysRename)
+            if writeText:
+                joinSeq = (wxDir, '/nightly', str(i), '/k', str(i), '_', name, '.txt')
+                file = ''.join(joinSeq)
+                night.write_text(i, name, file)
 
         # Create the plots
 
         files = ['temperature', 'humidity', 'pressure', 'dewpoint']
         columns = [names[0:4], names[4:6], names[6:7], names[7:]]
-        grp = []
-        grp.append(''.join(('Keck', str(i), '_Temperature')))
-        grp.append(''.join(('Keck', str(i), '_Humidity')))
-        grp.append(''.join(('Keck', str(i), '_Pressure')))
-        grp.append(''.join(('Keck', str(i), '_DewPoint')))
+        yLabel = ['Temperature (C)', 'Humidity (%)', 'Pressure (mbar)', 'Dewpoint (C)']
 
         colors = ['steelblue', 'orange', 'green', 'red']
         
-        curve_opts = dict(tools=['hover'])
         plot_opts = dict(height=400, width=450)
 
-        # Offsets for the 4 plots created
-        #  plot 1 = data[0:3]
-        #  plot 2 = data[4:5]
-        #  plot 3 = data[6:6]
-        #  plot 4 = data[7:7]
+        # Plain Bokeh writes the trimmed HTML directly
+
+        if backend == 'bokeh':
+            for key, plot in enumerate(files):
+                curves = []
+                for key2, c in enumerate(columns[key]):
+                    if not night.has(i, c): continue
+                    secs, vals = night.arrays(i, c, points, method)
+                    curves.append((secs, vals, c, colors[key2], night.channel(i, c)))
+                joinSeq = ('k', str(i), '_', plot)
+                plots.add_curves(''.join(joinSeq), curves, yLabel[key], **plot_opts)
+            continue
 
-        skip = [0, 4, 6, 7]
+        # Each plot renders in a worker process
 
-        renderer = hv.renderer('bokeh')
+        pool = get_pool()
         for key, plot in enumerate(files):
-            plt = None
-            for key2, c in enumerate(columns[key]):
-                index = key2 + skip[key]
-                p = hv.Curve(data[index], 'UT', c, label=c)#, group=grp[key])
-                c_opts = dict(color=colors[key2])
-                c_opts.update(curve_opts)
-                p = p.options(**c_opts)
-                if not plt:
-                    p = p.redim.label(OutsideTemp='Temperature (C)')
-                    p = p.redim.label(OutsideHumidity='Humidity (%)')
-                    p = p.redim.label(Dewpoint='Dewpoint (C)')
-                    p = p.redim.label(Pressure='Pressure (mbar)')
-                    p = p.redim.label(UT='Universal Time')
-                    plt = p
-                else: plt = plt * p
-                p = None
+            present = [key2 for key2, c in enumerate(columns[key]) if night.has(i, c)]
+            if not present: continue
+            frames = [night.frame(i, columns[key][key2], points=points, method=method) for key2 in present]
+            plotColumns = [columns[key][key2] for key2 in present]
+            plotColors = [colors[key2] for key2 in present]
             joinSeq = (wxDir, '/k', str(i), '_', plot)
             file = ''.join(joinSeq)
-            plt.options(width=450, height=400)
-            renderer.save(plt.options(**plot_opts), file)
-            if log_writer:
-                log_writer.info('make_nightly_plots.py file saved {}'.format(file))
-            fix_html(file + '.html', log_writer)
+            jobs.append((file, pool.submit(render_weather_plot, file, frames, plotColumns, plotColors, plot_opts)))
+
+    if savePlots:
+        plots.save(log_writer)
+    if waitJobs:
+        gather_plots(jobs, log_writer)
 
                     
-def make_fwhm_plots(utDate, wxDir, log_writer=''):
+def make_fwhm_plots(utDate, wxDir, log_writer='', night=None, writeText=True, backend='holoviews', points=0, method='lttb', plots=None, jobs=None):
     '''
     Create plots of nightly weather from envFocus.arT
 
     @type wxDir: string
     @param wxDir: directory to nightly data
+    @type night: NightData
+    @param night: the night's archiver data (default is to query the archiver)
+    @type writeText: bool
+    @param writeText: write the data to a .txt file (default is True)
+    @type backend: string
+    @param backend: holoviews (default) or bokeh
+    @type points: int
+    @param points: points plotted per channel (default is 0, all samples)
+    @type method: string
+    @param method: downsampling method, lttb (default) or minmax
+    @type plots: NightPlots
+    @param plots: collects the bokeh figures (default is to write wx_fwhm.json)
+    @type jobs: list
+    @param jobs: collects the (file, future) render jobs (default is to wait for them)
     '''
 
     split = utDate.split('-')
@@ -166,6 +262,19 @@ def make_fwhm_plots(utDate, wxDir, log_writer=''):
     month = split[1]
     day = split[2]
 
+    savePlots = backend == 'bokeh' and plots is None
+    waitJobs = jobs is None
+    if waitJobs:
+        jobs = []
+    if savePlots:
+        plots = bokeh_plots.NightPlots(wxDir, 'wx_fwhm')
+
+    # Query archive
+
+    if night is None:
+        channels = {i: [('fwhm', fwhm_channel(i))] for i in range(1,3)}
+        night = NightData.fetch(utDate, channels, log_writer)
+
     # For each nightly directory
 
     for i in range(1,3):
@@ -175,105 +284,126 @@ def make_fwhm_plots(utDate, wxDir, log_writer=''):
         if log_writer:
             log_writer.info('make_fwhm_plots.py creating fwhm plot for nightly{}'.format(i))
 
-        # Read the file and skip if error
+        # Skip if the channel could not be read
 
-        try:
-            channel = f'k{i}:dcs:pnt:cam0:fwhm'
-            data = get_archiver_data(utDate, i, channel)
-            joinSeq = (wxDir, '/nightly', str(i), '/k', str(i), '_fwhm.txt')
-            file = ''.join(joinSeq)
-            data.to_csv(file, sep='\t')
-        except IOError as e:
+        if not night.has(i, 'fwhm'):
             if log_writer:
                 log_writer.error('make_fwhm_plots.py unable read archiver data')
             continue
+        if writeText:
+            joinSeq = (wxDir, '/nightly', str(i), '/k', str(i), '_fwhm.txt')
+            file = ''.join(joinSeq)
+            night.write_text(i, 'fwhm', file)
 
-        # Set column headers or default to column numbers
-
-        keys = []
-        keys.append(channel)
+        # Create the plots
 
         files = ['fwhm']
         yLabel = ['FWHM (arcseconds)']
 
-        # This is needed to rename labels below
+        plot_opts = dict(height=300, width=450)
+        grp = []
+        grp.append(''.join((str(i))))
 
-        names = []
-        names.append('KECK')
-        columns = [names[0:]]
-        keysRename = dict(zip(keys, names))
-        data = data.rename(index=str, columns=keysRename)
-        for n in names:
-            data[n] = pd.to_numeric(data[n])
+        # Plain Bokeh writes the trimmed HTML directly, full resolution
+        # is in the .txt file so the plot can be downsampled
 
-        # Format time data
+        if backend == 'bokeh':
+            secs, vals = night.arrays(i, 'fwhm', points, method)
+            for key, plot in enumerate(files):
+                curves = [(secs, vals, 'KECK', 'steelblue', night.channel(i, 'fwhm'))]
+                joinSeq = ('k', str(i), '_', plot)
+                plots.add_curves(''.join(joinSeq), curves, yLabel[key], **plot_opts)
+            continue
 
-        data['UT'] = pd.to_datetime(data['timestamp'], format='%Y-%m-%d %H:%M:%S')
+        # Each plot renders in a worker process
 
-        # Create the plots
+        data = night.frame(i, 'fwhm', 'KECK', points, method)
+        pool = get_pool()
+        for key, plot in enumerate(files):
+            joinSeq = (wxDir, '/k', str(i), '_', plot)
+            file = ''.join(joinSeq)
+            jobs.append((file, pool.submit(render_fwhm_plot, file, data, grp[key], plot_opts)))
 
-        curve_opts = dict(tools=['hover'])
-        plot_opts = dict(height=300, width=450)
-        grp = []
-        grp.append(''.join((str(i))))
+    if savePlots:
+        plots.save(log_writer)
+    if waitJobs:
+        gather_plots(jobs, log_writer)
 
-        renderer = hv.renderer('bokeh')
-        for key, plot in enumerate(files):
-            p = hv.Curve(data, 'UT', 'KECK', label='KECK', group=grp[key])
-            c_opts = dict(color='steelblue')
-            c_opts.update(curve_opts)
-            p = p.options(**c_opts)
-            p = p.redim.label(KECK='FWHM (arcseconds)')
+
+def render_weather_plot(file, frames, columns, colors, plot_opts):
+    '''
+    Renders one weather plot to file.html, one curve per column.  Runs
+    in a render worker.  Returns True if the HTML header was removed.
+
+    @type frames: list
+    @param frames: data frame with UT and the column for each curve
+    '''
+
+    hv = get_hv()
+    renderer = hv.renderer('bokeh')
+    curve_opts = dict(tools=['hover'])
+
+    plt = None
+    for key2, c in enumerate(columns):
+        p = hv.Curve(frames[key2], 'UT', c, label=c)
+        c_opts = dict(color=colors[key2])
+        c_opts.update(curve_opts)
+        p = p.options(**c_opts)
+        if not plt:
+            p = p.redim.label(OutsideTemp='Temperature (C)')
+            p = p.redim.label(OutsideHumidity='Humidity (%)')
+            p = p.redim.label(Dewpoint='Dewpoint (C)')
+            p = p.redim.label(Pressure='Pressure (mbar)')
             p = p.redim.label(UT='Universal Time')
             plt = p
-            joinSeq = (wxDir, '/k', str(i), '_', plot)
-            file = ''.join(joinSeq)
-            plt.options(width=450, height=300)
-            renderer.save(plt.options(**plot_opts), file)
-            if log_writer:
-                log_writer.info('make_nightly_plots.py file saved {}'.format(file))
-            fix_html(file + '.html', log_writer)
+        else: plt = plt * p
+
+    return save_html(renderer, plt.options(**plot_opts), file)
+
+
+def render_fwhm_plot(file, data, group, plot_opts):
+    '''
+    Renders one FWHM plot to file.html.  Runs in a render worker.
+    Returns True if the HTML header was removed.
+
+    @type data: pandas data frame
+    @param data: frame with UT and KECK columns
+    '''
+
+    hv = get_hv()
+    renderer = hv.renderer('bokeh')
+    curve_opts = dict(tools=['hover'])
+
+    p = hv.Curve(data, 'UT', 'KECK', label='KECK', group=group)
+    c_opts = dict(color='steelblue')
+    c_opts.update(curve_opts)
+    p = p.options(**c_opts)
+    p = p.redim.label(KECK='FWHM (arcseconds)')
+    p = p.redim.label(UT='Universal Time')
+
+    return save_html(renderer, p.options(**plot_opts), file)
 
 
-def get_archiver_data(utDate, telNum, channel):
+def gather_plots(jobs, log_writer=''):
     '''
-    Uses the archiver API to retrieve JSON data for the
-    supplied channel. Returns a pandas data frame.
+    Waits for the render jobs and logs each file in submission order
+
+    @type jobs: list
+    @param jobs: (file, future) per plot
     '''
 
-    # K1ARCHIVER or K2ARCHIVER
-    api = f'K{telNum}ARCHIVER'
-
-    # times for the query
-    start = f'{utDate}T00:00:00Z'
-    end   = f'{utDate}T23:59:59Z'
-
-    config = configparser.ConfigParser()
-    config.read('config.live.ini')
-    archiveUrl = config['API'][api]
-    archiveUrl = f'{archiveUrl}pv={channel}&from={start}&to={end}'
-
-    # Retrieve data
-    data = urlopen(archiveUrl)
-    data = data.read().decode('utf8')
-    data = json.loads(data)
-
-    newdata = {}
-    newdata['timestamp'] = []
-    newdata['timeinsecs'] = []
-    newdata[channel] = []
-
-    for entry in data:
-        for d in entry['data']:
-            if 'acsTemp' in channel and d['val']>100: continue
-            timeString = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(d['secs']))
-            mydate, mytime = timeString.split(' ')
-            if mydate != utDate: continue
-            hr, mn, sc = mytime.split(':')
-            if int(hr) >= 18: continue
-            newdata['timestamp'].append(timeString)
-            newdata['timeinsecs'].append(d['secs'])
-            newdata[channel].append(d['val'])
-
-    newdata = pd.DataFrame(data=newdata)
-    return newdata
+    for file, future in jobs:
+        try:
+            trimmed = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                reset_pool()
+            if log_writer:
+                log_writer.error('make_nightly_plots.py unable to render {} ({})'.format(file, e))
+            continue
+        if log_writer:
+            if trimmed:
+                log_writer.info('fix_html.py file header updated')
+            else:
+                log_writer.info('fix_html.py data section not found')
+            log_writer.info('make_nightly_plots.py file saved {}'.format(file))
@@ -0,0 +1,186 @@
+#---------------------------------------------------------------
+#
+# Reader for the Mauna Kea Weather Center seeing .dat files
+# (YYYYMMDD.mkwc.{dimm,mass,masspro}.dat) written by get_dimm_data.
+#
+# Usage: mkwc.py [directory]
+#
+# Benchmarks the reader on every .mkwc.*.dat file under directory,
+# or on a year of generated DIMM files if no directory is given.
+#
+#---------------------------------------------------------------
+
+from datetime import timedelta
+import glob
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# Date columns at the start of each row, the extra masspro columns and
+# the column holding the seeing value for each type of file
+
+DATE_COLUMNS = ['year', 'month', 'day', 'hour', 'minute', 'second']
+MASSPRO_COLUMNS = ['a', 'b', 'c', 'd', 'e', 'f']
+SEEING_COLUMN = {'dimm': 6, 'mass': 6, 'masspro': 12}
+
+# Widest row accepted once the time is split into three columns,
+# shorter (ragged) rows are padded and wider rows are skipped
+
+MAX_COLUMNS = 24
+
+# Files are in HST, plots are in UT
+
+HST_OFFSET = timedelta(hours=10)
+
+def read_mkwc_dat(fileName, kind, log_writer=''):
+    '''
+    Reads a MKWC seeing file to a pandas data frame with the date
+    columns, seeing, the extra masspro columns and a UT date column.
+    Times may be written HH:MM:SS, HH: MM: SS or HH MM SS.  Rows missing
+    the date or seeing are dropped and a 'No Data' file gives an empty
+    frame.
+
+    @type fileName: string
+    @param fileName: .dat file to read
+    @type kind: string
+    @param kind: dimm, mass or masspro
+    @type log_writer: logging
+    @param log_writer: logger for skipped rows
+    '''
+
+    seeing = SEEING_COLUMN[kind]
+    names = DATE_COLUMNS.copy()
+    if kind == 'masspro':
+        names += MASSPRO_COLUMNS
+    names.append('seeing')
+
+    columns = list(range(seeing + 1))
+
+    with open(fileName, 'r') as fp:
+        text = fp.read()
+    if not text.strip() or text.startswith('No Data'):
+        return empty_frame(names)
+
+    # Time separators become whitespace so hour, minute and second are
+    # always separate columns
+
+    text = text.replace(':', ' ')
+
+    # Parse straight to float64, only if that fails coerce stray text
+    # to NaN
+
+    try:
+        data = pd.read_csv(io.StringIO(text), header=None, sep=r'\s+', engine='c', names=range(MAX_COLUMNS),
+                           dtype=np.float64, on_bad_lines='skip')
+    except ValueError:
+        data = pd.read_csv(io.StringIO(text), header=None, sep=r'\s+', engine='c', names=range(MAX_COLUMNS),
+                           dtype=str, on_bad_lines='skip')
+        data = data[columns].apply(lambda col: pd.to_numeric(col, errors='coerce'))
+
+    # Rows wider than MAX_COLUMNS were skipped
+
+    rows = len(re.findall(r'\S[^\n]*', text))
+    if len(data) < rows and log_writer:
+        log_writer.warning('mkwc.py skipped {} rows with over {} fields in {}'.format(rows - len(data), MAX_COLUMNS, fileName))
+
+    # Keep rows with the date and seeing, as one float64 block
+
+    values = data[columns].to_numpy(dtype=np.float64)
+    values = values[~np.isnan(values[:, list(range(6)) + [seeing]]).any(axis=1)]
+    data = pd.DataFrame(values, columns=names)
+
+    # Build the date from the integer columns
+
+    year, month, day, hour, minute, second = values[:, :6].astype(np.int64).T
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    secs = days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)
+    data['date'] = pd.to_datetime(secs.astype('datetime64[ns]')) + HST_OFFSET
+
+    return data
+
+
+def empty_frame(names):
+    '''
+    Returns an empty data frame with the reader's columns
+    '''
+
+    data = pd.DataFrame({name: np.array([], dtype=np.float64) for name in names})
+    data['date'] = pd.to_datetime(np.array([], dtype=np.int64))
+    return data
+
+
+def read_mkwc_dat_strings(fileName, kind):
+    '''
+    Previous reader, string columns and a formatted date parse of the
+    HH: MM: SS time columns.  Kept for the benchmark.
+    '''
+
+    keys = [0, 1, 2, 3, 4, 5, 6]
+    names = DATE_COLUMNS.copy()
+    if 'masspro' in kind:
+        keys += [7, 8, 9, 10, 11, 12]
+        names += MASSPRO_COLUMNS
+    names.append('seeing')
+
+    data = pd.read_csv(fileName, header=None, delimiter=' ', dtype=str)
+    keysRename = dict(zip(keys, names))
+    data = data.rename(index=str, columns=keysRename)
+    dateCol = pd.to_datetime(data['year']+data['month']+data['day']+' '+data['hour']+data['minute']+data['second'], format='%Y%m%d %H:%M:%S')
+    dateCol += HST_OFFSET
+    data = data.assign(date=dateCol)
+    data['seeing'] = pd.to_numeric(data['seeing'])
+    return data
+
+
+def make_test_files(outDir, days=365, rows=1500):
+    '''
+    Writes a year of DIMM-like files for the benchmark
+    '''
+
+    rng = np.random.default_rng(0)
+    files = []
+    start = pd.Timestamp('2019-01-01')
+    for n in range(days):
+        day = start + pd.Timedelta(days=n)
+        secs = np.sort(rng.integers(0, 86400, rows))
+        seeing = rng.gamma(4, 0.15, rows)
+        lines = []
+        for s, v in zip(secs, seeing):
+            t = day + pd.Timedelta(seconds=int(s))
+            lines.append(t.strftime('%Y %m %d %H: %M: %S') + f' {v:.2f}\n')
+        fileName = os.path.join(outDir, day.strftime('%Y%m%d') + '.mkwc.dimm.dat')
+        with open(fileName, 'w') as fp:
+            fp.writelines(lines)
+        files.append(fileName)
+    return files
+
+
+def benchmark(files):
+    '''
+    Times the previous and the typed reader on the files
+    '''
+
+    for name, reader in (('string', read_mkwc_dat_strings), ('typed', read_mkwc_dat)):
+        rows = 0
+        start = time.time()
+        for fileName in files:
+            kind = fileName.split('.')[-2]
+            try:
+                rows += len(reader(fileName, kind))
+            except Exception:
+                continue
+        print('{:<8}{:>6} files{:>10} rows{:>8.2f} s'.format(name, len(files), rows, time.time() - start))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark(sorted(glob.glob(os.path.join(sys.argv[1], '**', '*.mkwc.*.dat'), recursive=True)))
+    else:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            benchmark(make_test_files(tmpDir))
@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+
+def night_int(utDate):
+    '''
+    Returns YYYY-MM-DD or YYYYMMDD as the integer YYYYMMDD
+    '''
+
+    return int(utDate.replace('-', '').replace('/', ''))
+
+
+class MonthStore:
+    '''
+    Columnar store of NumPy arrays partitioned by month.  Each month is
+    one compressed YYYYMM.npz holding equal length columns, and a
+    manifest records the source files already ingested.
+
+    @type storeDir: string
+    @param storeDir: directory holding the partitions and manifest
+    '''
+
+    def __init__(self, storeDir):
+        self.storeDir = storeDir
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def locked(self, name='manifest'):
+        '''
+        Holds an exclusive lock on name, a month (YYYYMM) or the
+        manifest, shared with other processes and threads updating the
+        store
+
+        @type name: string
+        @param name: month or manifest (default)
+        '''
+
+        os.makedirs(self.storeDir, exist_ok=True)
+        joinSeq = (self.storeDir, '/', str(name), '.lock')
+        with open(''.join(joinSeq), 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def partition_file(self, month):
+        '''
+        Returns the file for month (YYYYMM)
+        '''
+
+        joinSeq = (self.storeDir, '/', str(month), '.npz')
+        return ''.join(joinSeq)
+
+    def months(self):
+        '''
+        Returns the sorted list of months (YYYYMM) with a partition
+        '''
+
+        try:
+            files = os.listdir(self.storeDir)
+        except OSError:
+            return []
+        return sorted(int(f[:6]) for f in files if f.endswith('.npz') and f[:6].isdigit())
+
+    def load(self, month):
+        '''
+        Returns the columns for month as a dictionary of arrays, or an
+        empty dictionary.  Partitions are kept in memory until the file
+        changes.
+
+        @type month: int
+        @param month: month to load (YYYYMM)
+        '''
+
+        file = self.partition_file(month)
+        try:
+            mtime = os.stat(file).st_mtime_ns
+        except OSError:
+            return {}
+
+        with self.lock:
+            if month in self.loaded and self.loaded[month][0] == mtime:
+                return self.loaded[month][1]
+
+        with np.load(file) as data:
+            columns = {key: data[key] for key in data.files}
+
+        with self.lock:
+            self.loaded[month] = (mtime, columns)
+        return columns
+
+    def save(self, month, columns):
+        '''
+        Writes the columns for month, replacing the partition
+
+        @type month: int
+        @param month: month to write (YYYYMM)
+        @type columns: dict
+        @param columns: dictionary of column name to array
+        '''
+
+        os.makedirs(self.storeDir, exist_ok=True)
+        fd, tmpFile = tempfile.mkstemp(dir=self.storeDir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez_compressed(fp, **columns)
+        os.replace(tmpFile, self.partition_file(month))
+
+    def replace(self, month, columns, key, keys=None):
+        '''
+        Replaces the rows of month whose key column is in keys with
+        columns.  Rows are kept sorted by key, the order within each key
+        is unchanged.  The month is locked while it is read and rewritten.
+
+        @type month: int
+        @param month: month to update (YYYYMM)
+        @type columns: dict
+        @param columns: dictionary of column name to array of new rows
+        @type key: string
+        @param key: column identifying the rows to replace, e.g. night
+        @type keys: list
+        @param keys: key values to replace (default is those in columns)
+        '''
+
+        if keys is None:
+            keys = np.unique(columns[key])
+
+        with self.locked(month):
+            old = self.load(month)
+            if old:
+                keep = ~np.isin(old[key], keys)
+                columns = {name: np.concatenate((old[name][keep], columns[name])) for name in columns}
+
+            order = np.argsort(columns[key], kind='stable')
+            self.save(month, {name: col[order] for name, col in columns.items()})
+
+    def select(self, key, start, end):
+        '''
+        Returns the rows with start <= key column <= end from every
+        month in range, concatenated.  start and end are YYYYMMDD ints
+        of a key column sorted within each month.
+
+        @type key: string
+        @param key: YYYYMMDD column to select on
+        '''
+
+        parts = []
+        for month in self.months():
+            if month < start // 100 or month > end // 100:
+                continue
+            columns = self.load(month)
+            if not columns:
+                continue
+            lo = np.searchsorted(columns[key], start, side='left')
+            hi = np.searchsorted(columns[key], end, side='right')
+            parts.append({name: col[lo:hi] for name, col in columns.items()})
+
+        if not parts:
+            return {}
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def read_manifest(self):
+        '''
+        Returns the dictionary of ingested source files to [size, mtime_ns]
+        '''
+
+        try:
+            with open(self.storeDir + '/manifest.json', 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest):
+        '''
+        Writes the dictionary of ingested source files to [size, mtime_ns].
+        Hold locked() from read_manifest() to here so concurrent updates
+        are not lost.
+        '''
+
+        os.makedirs(self.storeDir, exist_ok=True)
+        fd, tmpFile = tempfile.mkstemp(dir=self.storeDir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(manifest, fp)
+        os.replace(tmpFile, self.storeDir + '/manifest.json')
+
+    def update_nights(self, archiveDir, pattern, ingest, nights=None):
+        '''
+        Finds the nights under archiveDir with a source file that is new,
+        changed or removed since the last update and calls
+        ingest(month, nights, files) for each month of them, where files
+        is night to {source file: [size, mtime_ns]}.  The manifest is
+        locked throughout, so nights updated by other processes (e.g.
+        backfill workers) are not lost.  Returns the number of nights
+        ingested.
+
+        @type archiveDir: string
+        @param archiveDir: directory holding the YYYYMMDD night directories
+        @type pattern: string
+        @param pattern: glob of the source files in a night directory, {night} is YYYYMMDD
+        @type ingest: function
+        @param ingest: replaces the rows of the nights of one month
+        @type nights: list
+        @param nights: only check these UT dates (default is all)
+        '''
+
+        if nights:
+            dirs = [''.join((archiveDir, '/', str(night_int(n)))) for n in nights]
+        else:
+            dirs = glob.glob(archiveDir + '/' + '[0-9]' * 8)
+
+        with self.locked():
+
+            # Find the nights with a new, changed or removed file
+
+            manifest = self.read_manifest()
+            changed = {}
+            for nightDir in dirs:
+                night = os.path.basename(nightDir)
+                files = {}
+                for file in glob.glob(''.join((nightDir, '/', pattern.format(night=night)))):
+                    st = os.stat(file)
+                    files[os.path.relpath(file, archiveDir)] = [st.st_size, st.st_mtime_ns]
+                old = {f: v for f, v in manifest.items() if f.startswith(night + '/')}
+                if files != old:
+                    changed[int(night)] = files
+
+            # Ingest the changed nights a month at a time, recording each
+            # month's files once its rows are replaced
+
+            byMonth = {}
+            for night in sorted(changed):
+                byMonth.setdefault(night // 100, []).append(night)
+
+            for month, monthNights in byMonth.items():
+                ingest(month, monthNights, changed)
+
+                for night in monthNights:
+                    prefix = str(night) + '/'
+                    for file in [f for f in manifest if f.startswith(prefix)]:
+                        del manifest[file]
+                    manifest.update(changed[night])
+                self.write_manifest(manifest)
+
+        return len(changed)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from channel_series import ChannelSeries
+
+def archive_file(wxDir, telNum):
+    '''
+    Returns the nightly archive file for the telescope,
+    wxDir/nightly{telNum}/k{telNum}_archiver.npz
+    '''
+
+    joinSeq = (wxDir, '/nightly', str(telNum), '/k', str(telNum), '_archiver.npz')
+    return ''.join(joinSeq)
+
+
+def write_night_archive(wxDir, telNum, channels, log_writer=''):
+    '''
+    Writes all archiver channels of one telescope for the night to a
+    single compressed file.  Each channel is stored as typed arrays,
+    time_{name} (int64 epoch seconds) and value_{name} (float64), with
+    the names and archiver channels in the names and channels arrays.
+
+    @type wxDir: string
+    @param wxDir: directory to nightly data
+    @type telNum: int
+    @param telNum: telescope number (1 or 2)
+    @type channels: list
+    @param channels: (name, ChannelSeries) to write, see NightData.archive_channels
+    '''
+
+    names = []
+    pvs = []
+    arrays = {}
+    for name, series in channels:
+        names.append(name)
+        pvs.append(series.channel)
+        arrays['time_' + name] = series.secs
+        arrays['value_' + name] = series.vals
+
+    if not names:
+        if log_writer:
+            log_writer.error('night_archive.py no archiver data for nightly{}'.format(telNum))
+        return
+
+    file = archive_file(wxDir, telNum)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmpFile = file + '.tmp'
+    with open(tmpFile, 'wb') as fp:
+        np.savez_compressed(fp, names=np.array(names), channels=np.array(pvs), **arrays)
+    os.replace(tmpFile, file)
+
+    if log_writer:
+        log_writer.info('night_archive.py file saved {}'.format(file))
+
+
+def read_night_archive(file):
+    '''
+    Returns a dictionary of name to ChannelSeries from a nightly
+    archive file
+
+    @type file: string
+    @param file: file written by write_night_archive
+    '''
+
+    channels = {}
+    with np.load(file) as data:
+        for name, channel in zip(data['names'], data['channels']):
+            name = str(name)
+            channels[name] = ChannelSeries(str(channel), data['time_' + name], data['value_' + name])
+    return channels
+
+
+def read_night_frame(file, name):
+    '''
+    Returns one channel of a nightly archive file as the data frame
+    get_archiver_data returns (timestamp, timeinsecs and channel columns)
+
+    @type file: string
+    @param file: file written by write_night_archive
+    @type name: string
+    @param name: channel name, e.g. OutsideTemp or fwhm
+    '''
+
+    return read_night_archive(file)[name].to_frame()
@@ -0,0 +1,132 @@
+import pandas as pd
+from archiver import fetch_archiver_arrays
+from channel_series import ChannelSeries
+from downsample import downsample_arrays
+
+class NightData:
+    '''
+    Archiver channels of one night for both telescopes, retrieved once.
+    Each channel is kept as a ChannelSeries, int64 epoch seconds and
+    float64 values.  The plots and file writers read views of these
+    arrays, so nothing is copied or converted to strings per plot.
+
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    '''
+
+    def __init__(self, utDate):
+        self.utDate = utDate
+        self.series = {}
+
+    @classmethod
+    def fetch(cls, utDate, channels, log_writer='', useCache=True, stream=None):
+        '''
+        Returns the night's data with every channel retrieved by one
+        fetch_archiver_arrays call.  Channels that could not be retrieved
+        are left out.
+
+        @type utDate: string
+        @param utDate: UT date (YYYY-MM-DD)
+        @type channels: dict
+        @param channels: telNum to list of (name, archiver channel)
+        @type useCache: bool
+        @param useCache: use the local archiver cache (default is True)
+        @type stream: bool
+        @param stream: parse the archiver responses incrementally (default is from config.live.ini)
+        '''
+
+        queries = []
+        for telNum, pairs in channels.items():
+            queries += [(telNum, channel) for name, channel in pairs]
+        data = fetch_archiver_arrays(utDate, queries, log_writer=log_writer, useCache=useCache, stream=stream)
+
+        night = cls(utDate)
+        for telNum, pairs in channels.items():
+            for name, channel in pairs:
+                if (telNum, channel) in data:
+                    night.add(telNum, name, channel, *data[(telNum, channel)])
+        return night
+
+    def add(self, telNum, name, channel, secs, vals):
+        '''
+        Adds one channel from its (secs, vals) arrays
+
+        @type telNum: int
+        @param telNum: telescope number (1 or 2)
+        @type name: string
+        @param name: column name, e.g. OutsideTemp or fwhm
+        @type channel: string
+        @param channel: archiver PV name
+        '''
+
+        self.series[(telNum, name)] = ChannelSeries(channel, secs, vals)
+
+    def has(self, telNum, name):
+        '''
+        Returns True if the channel was retrieved
+        '''
+
+        return (telNum, name) in self.series
+
+    def names(self, telNum):
+        '''
+        Returns the names of the telescope's channels in the order added
+        '''
+
+        return [name for (i, name) in self.series if i == telNum]
+
+    def channel(self, telNum, name):
+        '''
+        Returns the archiver PV name of a channel
+        '''
+
+        return self.series[(telNum, name)].channel
+
+    def arrays(self, telNum, name, points=0, method='lttb'):
+        '''
+        Returns the (secs, vals) arrays of a channel, downsampled to
+        points for plotting if points is given (see downsample.py)
+
+        @type points: int
+        @param points: number of points to keep (default is 0, all samples)
+        @type method: string
+        @param method: lttb (default) or minmax
+        '''
+
+        series = self.series[(telNum, name)]
+        return downsample_arrays(series.secs, series.vals, points, method)
+
+    def frame(self, telNum, name, column='', points=0, method='lttb'):
+        '''
+        Returns a data frame with the UT as datetimes and the values in
+        column (default is name), for the HoloViews plots.  UT is
+        converted from the epoch seconds directly.
+
+        @type column: string
+        @param column: name of the value column
+        '''
+
+        secs, vals = self.arrays(telNum, name, points, method)
+        data = {}
+        data['UT'] = pd.to_datetime(secs, unit='s')
+        data[column or name] = vals
+        return pd.DataFrame(data=data)
+
+    def write_text(self, telNum, name, file):
+        '''
+        Writes a channel to a tab separated .txt file with the timestamp,
+        timeinsecs and channel columns of get_archiver_data
+
+        @type file: string
+        @param file: .txt file to write
+        '''
+
+        self.series[(telNum, name)].to_frame().to_csv(file, sep='\t')
+
+    def archive_channels(self, telNum):
+        '''
+        Returns the (name, ChannelSeries) of each of the telescope's
+        channels, for write_night_archive
+        '''
+
+        return [(name, self.series[(telNum, name)]) for name in self.names(telNum)]
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+
+class Stage:
+    '''
+    A named step of the nightly run
+
+    @type name: string
+    @param name: stage name
+    @type func: function
+    @param func: called with no arguments to run the stage
+    @type deps: list
+    @param deps: names of the stages that must complete first
+    '''
+
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+
+
+class Pipeline:
+    '''
+    Runs stages as soon as their dependencies complete, with
+    independent stages running concurrently
+
+    @type stages: list
+    @param stages: Stage objects
+    @type maxWorkers: int
+    @param maxWorkers: maximum stages to run at once
+    '''
+
+    def __init__(self, stages, maxWorkers=4, log_writer=''):
+        self.stages = {}
+        for stage in stages:
+            for dep in stage.deps:
+                assert dep in self.stages, f'pipeline.py unknown dependency {dep} for {stage.name}'
+            self.stages[stage.name] = stage
+        self.maxWorkers = maxWorkers
+        self.log_writer = log_writer
+        self.status = {}
+        self.timings = {}
+
+    def run(self, only=None):
+        '''
+        Runs all stages, or only the named stages (their dependencies
+        are assumed to have completed in an earlier run).  Returns a
+        dictionary of stage name to status ('ok', 'failed' or 'skipped').
+
+        @type only: list
+        @param only: names of the stages to run (default is all)
+        '''
+
+        if only:
+            for name in only:
+                assert name in self.stages, f'pipeline.py unknown stage {name}'
+            names = [name for name in self.stages if name in only]
+        else:
+            names = list(self.stages)
+
+        pending = list(names)
+        running = {}
+        self.status = {}
+        self.timings = {}
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while pending or running:
+
+                # Start every stage whose dependencies are done
+
+                for name in list(pending):
+                    deps = [dep for dep in self.stages[name].deps if dep in names]
+                    if any(self.status.get(dep) in ('failed', 'skipped') for dep in deps):
+                        pending.remove(name)
+                        self.status[name] = 'skipped'
+                        if self.log_writer:
+                            self.log_writer.error('pipeline.py stage {} skipped'.format(name))
+                    elif all(self.status.get(dep) == 'ok' for dep in deps):
+                        pending.remove(name)
+                        running[pool.submit(self.run_stage, name)] = name
+
+                if not running:
+                    continue
+
+                done, notDone = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    self.status[name] = future.result()
+
+        return self.status
+
+    def run_stage(self, name):
+        '''
+        Runs one stage, records its time and returns its status
+        '''
+
+        if self.log_writer:
+            self.log_writer.info('pipeline.py stage {} started'.format(name))
+
+        start = time.time()
+        try:
+            self.stages[name].func()
+            status = 'ok'
+        except Exception as e:
+            status = 'failed'
+            if self.log_writer:
+                self.log_writer.error('pipeline.py stage {} failed ({})'.format(name, e))
+        self.timings[name] = time.time() - start
+
+        if self.log_writer:
+            self.log_writer.info('pipeline.py stage {} {} in {:.1f} s'.format(name, status, self.timings[name]))
+
+        return status
@@ -0,0 +1,35 @@
+import configparser
+import os
+import threading
+
+# HoloViews with the Bokeh extension, imported by the first plot so
+# commands that do not plot skip the plotting stack's startup time
+
+hv = None
+hvLock = threading.Lock()
+
+def get_hv():
+    '''
+    Returns the holoviews module, importing it and loading the Bokeh
+    extension on first use
+    '''
+
+    global hv
+    with hvLock:
+        if hv is None:
+            import holoviews
+            holoviews.extension('bokeh')
+            hv = holoviews
+    return hv
+
+
+def get_backend():
+    '''
+    Returns the nightly plot backend, PLOTBACKEND in the API section of
+    config.live.ini: holoviews (default) or bokeh (see bokeh_plots.py)
+    '''
+
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.get('API', 'PLOTBACKEND', fallback='holoviews')
@@ -0,0 +1,101 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+import configparser
+import multiprocessing
+import os
+import threading
+
+# Most render worker processes started by default, one per CPU up to this
+
+PROCESSES = 4
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+def get_processes():
+    '''
+    Returns the number of render processes, RENDERPROCESSES in the API
+    section of config.live.ini (0 or 1 renders in the calling process)
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    processes = min(PROCESSES, os.cpu_count() or 1)
+    return config.getint('API', 'RENDERPROCESSES', fallback=processes)
+
+
+def init_worker():
+    '''
+    Loads the plotting modules once per worker
+    '''
+
+    import plotting
+    plotting.get_hv()
+
+
+# HoloViews is not thread safe and the pipeline stages submit from
+# several threads, so jobs run in this process one at a time
+
+renderLock = threading.Lock()
+
+class SerialPool:
+    '''
+    Runs each job when it is submitted, for a single render process
+    '''
+
+    def submit(self, func, *args):
+        future = Future()
+        with renderLock:
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+
+# Pool shared by all plots in this process.  Workers are spawned rather
+# than forked since the nightly run has other threads going, and they
+# stay up with the plotting stack loaded until the process exits.
+
+pool = None
+poolLock = threading.Lock()
+
+def get_pool():
+    '''
+    Returns the shared render pool, creating it on first use.  Jobs
+    are submitted with get_pool().submit(func, *args), func and args
+    must be picklable.
+    '''
+
+    global pool
+    with poolLock:
+        if pool is None:
+            processes = get_processes()
+            if processes > 1:
+                context = multiprocessing.get_context('spawn')
+                pool = ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=init_worker)
+            else:
+                pool = SerialPool()
+    return pool
+
+
+def reset_pool():
+    '''
+    Drops the shared pool, e.g. after a worker died, so the next
+    get_pool() starts a new one
+    '''
+
+    global pool
+    with poolLock:
+        if isinstance(pool, ProcessPoolExecutor):
+            pool.shutdown(wait=False)
+        pool = None
+
+
+def use_serial_pool():
+    '''
+    Renders in the calling process from now on, for processes that are
+    already one of a pool of workers (see backfill.py)
+    '''
+
+    global pool
+    with poolLock:
+        pool = SerialPool()
@@ -0,0 +1,212 @@
+#---------------------------------------------------------------
+#
+# Index of the MKWC seeing data of every archived night, stored
+# by month (see month_store.py) so statistics over any period are
+# answered without reparsing the nightly .dat files.
+#
+# Usage: seeing_index.py archiveDir [YYYY-MM-DD [YYYY-MM-DD]] [-kind dimm|mass|masspro]
+#
+# Updates the index with the nights under archiveDir that are new or
+# changed, then prints the seeing percentiles for the night or period.
+#
+#---------------------------------------------------------------
+
+import configparser
+import os
+import sys
+import numpy as np
+from month_store import MonthStore, night_int
+from mkwc import read_mkwc_dat
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Types of seeing file, stored as their position in this list
+
+KINDS = ['dimm', 'mass', 'masspro']
+
+# Default percentiles returned by the queries
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+def get_index_dir(archiveDir):
+    '''
+    Returns the index directory, SEEINGINDEX in the API section of
+    config.live.ini (default is archiveDir/seeing_index)
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.get('API', 'SEEINGINDEX', fallback=archiveDir+'/seeing_index')
+
+
+class SeeingIndex:
+    '''
+    Seeing samples of every ingested night with night (YYYYMMDD), kind
+    (index in KINDS), time (UT epoch seconds) and seeing columns
+
+    @type indexDir: string
+    @param indexDir: directory holding the index
+    '''
+
+    def __init__(self, indexDir):
+        self.store = MonthStore(indexDir)
+
+    def update(self, archiveDir, nights=None, log_writer=''):
+        '''
+        Ingests the seeing files of the nights under archiveDir that are
+        new or changed since the last update.  Returns the number of
+        nights ingested.
+
+        @type archiveDir: string
+        @param archiveDir: directory holding the YYYYMMDD night directories
+        @type nights: list
+        @param nights: only check these UT dates (default is all)
+        '''
+
+        # Reparse each changed night and replace its rows in its month
+
+        def ingest(month, monthNights, files):
+            parts = [self.read_night(archiveDir, night, files[night], log_writer) for night in monthNights]
+            columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+            self.store.replace(month, columns, 'night', monthNights)
+
+        changed = self.store.update_nights(archiveDir, '{night}.mkwc.*.dat', ingest, nights)
+
+        if log_writer:
+            log_writer.info('seeing_index.py ingested {} nights'.format(changed))
+
+        return changed
+
+    def read_night(self, archiveDir, night, files, log_writer=''):
+        '''
+        Returns the columns for one night's seeing files, sorted by kind
+        then time
+        '''
+
+        parts = []
+        for file in sorted(files):
+            kind = file.split('.')[-2]
+            if kind not in KINDS:
+                continue
+            try:
+                data = read_mkwc_dat(archiveDir + '/' + file, kind, log_writer)
+            except Exception as e:
+                if log_writer:
+                    log_writer.warning('seeing_index.py unable to read {} ({})'.format(file, e))
+                continue
+            count = len(data)
+            parts.append({
+                'night': np.full(count, night, dtype=np.int32),
+                'kind': np.full(count, KINDS.index(kind), dtype=np.int8),
+                'time': data['date'].values.astype('datetime64[s]').astype(np.int64),
+                'seeing': data['seeing'].values.astype(np.float64),
+            })
+
+        # A night with no readable files still replaces its old rows
+
+        if not parts:
+            return {
+                'night': np.array([], dtype=np.int32),
+                'kind': np.array([], dtype=np.int8),
+                'time': np.array([], dtype=np.int64),
+                'seeing': np.array([], dtype=np.float64),
+            }
+
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.lexsort((columns['time'], columns['kind']))
+        return {name: col[order] for name, col in columns.items()}
+
+    def select(self, startDate, endDate, kind):
+        '''
+        Returns the night and seeing arrays of kind from startDate to
+        endDate (inclusive)
+        '''
+
+        columns = self.store.select('night', night_int(startDate), night_int(endDate))
+        if not columns:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+        mask = columns['kind'] == KINDS.index(kind)
+        return columns['night'][mask], columns['seeing'][mask]
+
+    def period_percentiles(self, startDate, endDate, kind='dimm', percentiles=PERCENTILES):
+        '''
+        Returns a dictionary of percentile to seeing over all samples
+        from startDate to endDate (inclusive), or None without samples
+
+        @type startDate: string
+        @param startDate: first UT date (YYYY-MM-DD)
+        @type endDate: string
+        @param endDate: last UT date (YYYY-MM-DD)
+        @type kind: string
+        @param kind: dimm, mass or masspro
+        @type percentiles: list
+        @param percentiles: percentiles to return
+        '''
+
+        nights, seeing = self.select(startDate, endDate, kind)
+        if len(seeing) == 0:
+            return None
+        return dict(zip(percentiles, np.percentile(seeing, percentiles)))
+
+    def night_percentiles(self, utDate, kind='dimm', percentiles=PERCENTILES):
+        '''
+        Returns a dictionary of percentile to seeing for one night, or
+        None without samples
+        '''
+
+        return self.period_percentiles(utDate, utDate, kind, percentiles)
+
+    def nightly_percentiles(self, startDate, endDate, kind='dimm', percentiles=PERCENTILES):
+        '''
+        Returns a dictionary of night (YYYYMMDD) to a dictionary of
+        percentile to seeing for each night from startDate to endDate
+        '''
+
+        nights, seeing = self.select(startDate, endDate, kind)
+        result = {}
+        if len(seeing) == 0:
+            return result
+
+        # Rows are sorted by night, so each night is one slice
+
+        keys, starts = np.unique(nights, return_index=True)
+        ends = np.append(starts[1:], len(nights))
+        for night, lo, hi in zip(keys, starts, ends):
+            result[int(night)] = dict(zip(percentiles, np.percentile(seeing[lo:hi], percentiles)))
+        return result
+
+
+def main():
+    '''
+    Updates the index and prints the percentiles for the command line
+    arguments
+    '''
+
+    args = sys.argv[1:]
+    assert args, 'Usage: seeing_index.py archiveDir [YYYY-MM-DD [YYYY-MM-DD]] [-kind dimm|mass|masspro]'
+
+    kind = 'dimm'
+    if '-kind' in args:
+        i = args.index('-kind')
+        kind = args[i+1]
+        del args[i:i+2]
+
+    archiveDir = args[0]
+    index = SeeingIndex(get_index_dir(archiveDir))
+    print('Ingested {} nights'.format(index.update(archiveDir)))
+
+    if len(args) < 2:
+        return
+    startDate = args[1]
+    endDate = args[2] if len(args) > 2 else startDate
+
+    stats = index.period_percentiles(startDate, endDate, kind)
+    if stats is None:
+        print('No {} data from {} to {}'.format(kind, startDate, endDate))
+        return
+    for percentile, value in stats.items():
+        print('{:>4}%  {:.3f}'.format(percentile, value))
+
+
+if __name__ == '__main__':
+    main()
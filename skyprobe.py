@@ -1,8 +1,8 @@
 from datetime import datetime
-import urllib.request
 import os
 import verification
 import update_wx_db as wxdb
+from download import get_manager
 
 def skyprobe(utDate='', dir='.', log_writer=''):
     '''
@@ -49,9 +49,8 @@ def skyprobe(utDate='', dir='.', log_writer=''):
     joinSeq = (dir, '/skyprobe.png')
     writeFile = ''.join(joinSeq)
 
-    try:
-        urllib.request.urlretrieve(url, writeFile)
-    except:
+    error = get_manager().fetch(url, writeFile)
+    if error:
         if log_writer:
             log_writer.info('skyprobe.py url does not exist - {}'.format(url))
             sendUrl = ''.join(('cmd=updateWxDb&utdate=', dbDate, '&column=skyprobe&value=ERROR'))
@@ -0,0 +1,117 @@
+import calendar
+import json
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+UT_DATE = '2020-01-01'
+START = calendar.timegm(time.strptime(UT_DATE, '%Y-%m-%d'))
+
+
+class ArchiverHandler(BaseHTTPRequestHandler):
+    '''
+    Stand-in for the archiver getData.json API.  Each pv gets one sample
+    per minute, shifted by server.offsets[pv] seconds, with the value set
+    to hours since 00:00 UT.  pvs in server.missing are left out.
+    '''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        pvs = query.get('pv', [])
+        server.queries.append(pvs)
+        if server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if server.firstOnly:
+            pvs = pvs[:1]
+        pvs = [pv for pv in pvs if pv not in server.missing]
+
+        def samples(pv):
+            first = START + server.offsets.get(pv, 0)
+            return [{'secs': s, 'val': (s - START) / 3600.0} for s in range(first, START + 86400, 60)]
+
+        body = json.dumps([{'meta': {'name': pv}, 'data': samples(pv)} for pv in pvs]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def archiver_server():
+    '''
+    Starts a stand-in archiver, yields the server with its query URL
+    in server.url
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiverHandler)
+    server.queries = []
+    server.fail = False
+    server.firstOnly = False
+    server.offsets = {}
+    server.missing = set()
+    server.url = f'http://127.0.0.1:{server.server_port}/retrieval/data/getData.json?'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    '''
+    Stand-in web server for downloads.  Serves server.body with
+    server.etag and server.lastModified, answering 304 when the
+    request's validators match.  Request headers are kept in
+    server.requests.
+    '''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', server.lastModified)
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+
+@pytest.fixture
+def http_server():
+    '''
+    Starts a stand-in web server, yields the server with its base URL
+    in server.url
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    server.requests = []
+    server.body = b'image'
+    server.etag = '"v1"'
+    server.lastModified = 'Wed, 01 Jan 2020 00:00:00 GMT'
+    server.url = f'http://127.0.0.1:{server.server_port}/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,92 @@
+import numpy as np
+import archiver
+from conftest import UT_DATE, START
+
+
+def test_get_archiver_data(archiver_server):
+    data = archiver.get_archiver_data(UT_DATE, 1, 'k1:met:tempRaw', archiver_server.url, useCache=False)
+
+    # Samples from 00:00 to 18:00 UT are kept
+
+    assert len(data) == 18 * 60
+    assert list(data.columns) == ['timestamp', 'timeinsecs', 'k1:met:tempRaw']
+    assert data['timeinsecs'].iloc[0] == START
+    assert data['timestamp'].iloc[0] == '2020-01-01 00:00:00'
+    assert archiver_server.queries == [['k1:met:tempRaw']]
+
+
+def test_fetch_archiver_data(archiver_server):
+    queries = [(1, 'k1:met:tempRaw'), (1, 'k0:met:pressureRaw'), (2, 'k2:met:tempRaw')]
+    urls = {1: archiver_server.url, 2: archiver_server.url}
+    data = archiver.fetch_archiver_data(UT_DATE, queries, archiveUrls=urls, useCache=False)
+
+    assert sorted(data) == sorted(queries)
+    np.testing.assert_allclose(data[(2, 'k2:met:tempRaw')]['k2:met:tempRaw'].iloc[:2], [0.0, 1 / 60.0])
+
+    # One batched query per telescope
+
+    assert sorted(archiver_server.queries) == [['k1:met:tempRaw', 'k0:met:pressureRaw'], ['k2:met:tempRaw']]
+
+
+def test_get_archiver_url(tmp_path, monkeypatch):
+    with open(tmp_path / 'config.live.ini', 'w') as fp:
+        fp.write('[API]\nK1ARCHIVER = http://archiver.test/k1?\n')
+    monkeypatch.setattr(archiver, 'dir_path', str(tmp_path))
+
+    # The config is found from any working directory
+
+    monkeypatch.chdir('/')
+    assert archiver.get_archiver_url(1) == 'http://archiver.test/k1?'
+
+
+def test_fetch_archiver_data_missing_channels(archiver_server):
+    archiver_server.firstOnly = True
+    queries = [(1, 'a:b'), (1, 'c:d'), (1, 'e:f')]
+    data = archiver.fetch_archiver_data(UT_DATE, queries, archiveUrls={1: archiver_server.url}, useCache=False)
+
+    # Channels the batch left out are queried on their own
+
+    assert sorted(data) == sorted(queries)
+    assert archiver_server.queries[0] == ['a:b', 'c:d', 'e:f']
+    assert sorted(archiver_server.queries[1:]) == [['c:d'], ['e:f']]
+    assert len(data[(1, 'e:f')]) == 18 * 60
+
+
+def test_archiver_stream(archiver_server, tmp_path, monkeypatch):
+    with open(tmp_path / 'config.live.ini', 'w') as fp:
+        fp.write('[API]\nARCHIVERSTREAM = true\n')
+    monkeypatch.setattr(archiver, 'dir_path', str(tmp_path))
+    assert archiver.get_stream()
+
+    # Streamed responses give the same arrays
+
+    queries = [(1, 'k1:met:tempRaw'), (1, 'k0:met:pressureRaw')]
+    urls = {1: archiver_server.url}
+    streamed = archiver.fetch_archiver_arrays(UT_DATE, queries, archiveUrls=urls, useCache=False)
+    loaded = archiver.fetch_archiver_arrays(UT_DATE, queries, archiveUrls=urls, useCache=False, stream=False)
+    for query in queries:
+        np.testing.assert_array_equal(streamed[query][0], loaded[query][0])
+        np.testing.assert_array_equal(streamed[query][1], loaded[query][1])
+
+
+def test_get_archiver_data_multi(archiver_server, monkeypatch):
+    archiver_server.offsets = {'k1:met:humRaw': 30}
+    archiver_server.missing = {'k1:met:windSpeed'}
+    channels = ['k1:met:tempRaw', 'k1:met:humRaw', 'k1:met:windSpeed']
+
+    # Room for about two pvs per query
+
+    url = archiver_server.url
+    monkeypatch.setattr(archiver, 'MAX_URL_LENGTH', len(archiver.query_url(url, UT_DATE, channels[:2])) + 1)
+    data = archiver.get_archiver_data_multi(UT_DATE, 1, channels, url, useCache=False)
+
+    assert archiver_server.queries == [channels[:2], channels[2:]]
+
+    # One row per sample time of either channel, the missing one is left out
+
+    assert list(data.columns) == ['timestamp', 'timeinsecs', 'k1:met:tempRaw', 'k1:met:humRaw']
+    assert len(data) == 2 * 18 * 60
+    assert data['timeinsecs'].is_monotonic_increasing
+    assert list(data['timeinsecs'][:2]) == [START, START + 30]
+    assert data['k1:met:tempRaw'].isna().sum() == 18 * 60
+    assert data['k1:met:humRaw'].isna().sum() == 18 * 60
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import archiver_cache
+
+
+def test_cache_put_walks_once(tmp_path, monkeypatch):
+    cacheDir = str(tmp_path)
+    walks = []
+    evict = archiver_cache.evict
+    monkeypatch.setattr(archiver_cache, 'evict', lambda *args: walks.append(args) or evict(*args))
+
+    secs = np.arange(100, dtype=np.int64)
+    for day in range(1, 6):
+        archiver_cache.cache_put(1, 'k1:met:tempRaw', '2020-01-0{}'.format(day), secs, secs * 1.0, cacheDir, 10 ** 9)
+
+    # The cache is walked on the first write only, the size is then tracked
+
+    assert len(walks) == 1
+    sizes = [os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(cacheDir) for f in files]
+    assert archiver_cache.cacheSizes[cacheDir] == sum(sizes)
+
+    secs, vals = archiver_cache.cache_get(1, 'k1:met:tempRaw', '2020-01-05', cacheDir)
+    assert len(secs) == 100
+
+
+def test_cache_put_evicts(tmp_path):
+    cacheDir = str(tmp_path)
+    secs = np.arange(1000, dtype=np.int64)
+    file = archiver_cache.cache_file(cacheDir, 1, 'k1:met:tempRaw', '2020-01-01')
+    archiver_cache.cache_put(1, 'k1:met:tempRaw', '2020-01-01', secs, secs * 1.0, cacheDir, 10 ** 9)
+    cacheSize = int(os.path.getsize(file) * 2.5)
+    for day in range(2, 6):
+        archiver_cache.cache_put(1, 'k1:met:tempRaw', '2020-01-0{}'.format(day), secs, secs * 1.0, cacheDir, cacheSize)
+
+    # Only the two most recent nights are kept under the limit
+
+    assert archiver_cache.cacheSizes[cacheDir] <= cacheSize
+    kept = [day for day in range(1, 6) if archiver_cache.cache_get(1, 'k1:met:tempRaw', '2020-01-0{}'.format(day), cacheDir) is not None]
+    assert kept == [4, 5]
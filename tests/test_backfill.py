@@ -0,0 +1,28 @@
+import pytest
+import backfill
+
+
+def run_main(monkeypatch, args):
+    calls = []
+    monkeypatch.setattr(backfill, 'argv', ['backfill.py', '/tmp/wx', '2020-01-01', '2020-01-02'] + args)
+    monkeypatch.setattr(backfill, 'backfill', lambda *args: calls.append(args))
+    backfill.main()
+    return calls[0]
+
+
+def test_main_flags(monkeypatch):
+    args = run_main(monkeypatch, ['-processes', '2', '-nodb', '-nocache', '-notext'])
+    assert args == ('/tmp/wx', '2020-01-01', '2020-01-02', 2, 0, False, False)
+
+
+@pytest.mark.parametrize('args', [['-nodbb'], ['-processes'], ['-processes', '-nodb']])
+def test_main_rejects_bad_arguments(monkeypatch, args):
+
+    # A mistyped flag must not run the range with the database updates on
+
+    with pytest.raises(AssertionError, match='Usage'):
+        run_main(monkeypatch, args)
+
+
+def test_date_range():
+    assert backfill.date_range('2019-12-31', '2020/01/02') == ['2019-12-31', '2020-01-01', '2020-01-02']
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import checksum
+
+
+def make_files(wxDir):
+    os.makedirs(wxDir + '/nightly1')
+    for name, body in (('index.html', b'index'), ('nightly1/k1.txt', b'temp' * 1000), ('skyprobe.png', b'png')):
+        with open(wxDir + '/' + name, 'wb') as fp:
+            fp.write(body)
+
+
+def test_md5sum_manifest(tmp_path, monkeypatch):
+    wxDir = str(tmp_path / 'wx')
+    make_files(wxDir)
+    manifestFile = str(tmp_path / 'weather.manifest')
+    md5sumFile = wxDir + '/weather20200101.md5sum'
+    first = checksum.md5sum(wxDir, md5sumFile, manifestFile=manifestFile)
+
+    # Change one file, keeping its size
+
+    with open(wxDir + '/skyprobe.png', 'wb') as fp:
+        fp.write(b'PNG')
+    os.utime(wxDir + '/skyprobe.png', ns=(0, 10 ** 18))
+
+    hashed = []
+    md5_file = checksum.md5_file
+    monkeypatch.setattr(checksum, 'md5_file', lambda fullPath: hashed.append(fullPath) or md5_file(fullPath))
+    second = checksum.md5sum(wxDir, md5sumFile, manifestFile=manifestFile)
+    with open(md5sumFile) as fp:
+        reused = fp.read()
+
+    # Only the changed file is read again
+
+    assert hashed == [wxDir + '/skyprobe.png']
+    assert hashlib.md5(b'PNG').hexdigest() + '  ./skyprobe.png\n' in reused
+
+    # The output matches a run without a manifest
+
+    third = checksum.md5sum(wxDir, md5sumFile)
+    with open(md5sumFile) as fp:
+        assert fp.read() == reused
+    assert second == third == first
+    assert len(hashed) == 4
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import download
+
+
+class Response:
+    '''
+    Stand-in response carrying only the validator headers
+    '''
+
+    headers = {'etag': '"v1"', 'last-modified': 'Wed, 01 Jan 2020 00:00:00 GMT'}
+
+
+def store_many(cacheDir, bodyFile, errors):
+    cache = download.HttpCache(cacheDir)
+    for i in range(50):
+        try:
+            cache.store('http://example.test/dimmdailyhistogram.jpg', Response(), bodyFile)
+        except OSError:
+            errors.value += 1
+
+
+def test_concurrent_store(tmp_path):
+    cacheDir = str(tmp_path / 'cache')
+    errors = multiprocessing.Value('i', 0)
+    procs = []
+    for n in range(4):
+        bodyFile = str(tmp_path / 'body{}.jpg'.format(n))
+        with open(bodyFile, 'wb') as fp:
+            fp.write(b'jpeg')
+        procs.append(multiprocessing.Process(target=store_many, args=(cacheDir, bodyFile, errors)))
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+    # Every store succeeded and no temporary files are left
+
+    assert errors.value == 0
+    assert sorted(f.split('.', 1)[1] for f in os.listdir(cacheDir)) == ['body', 'json']
+
+
+def test_conditional_requests(http_server, tmp_path):
+    manager = download.DownloadManager(cache=download.HttpCache(str(tmp_path / 'cache')))
+    url = http_server.url + 'dimmdailyhistogram.jpg'
+
+    # First download stores the body and validators
+
+    assert manager.fetch(url, str(tmp_path / 'night1.jpg')) == ''
+    assert 'If-None-Match' not in http_server.requests[0]
+    assert manager.cache.headers(url) == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Wed, 01 Jan 2020 00:00:00 GMT'}
+
+    # Unchanged, the server answers 304 and the cached body is restored
+
+    assert manager.fetch(url, str(tmp_path / 'night2.jpg')) == ''
+    assert http_server.requests[1]['If-None-Match'] == '"v1"'
+    assert http_server.requests[1]['If-Modified-Since'] == 'Wed, 01 Jan 2020 00:00:00 GMT'
+    with open(tmp_path / 'night2.jpg', 'rb') as fp:
+        assert fp.read() == b'image'
+
+    # Changed, the new body replaces the cached one
+
+    http_server.body = b'new image'
+    http_server.etag = '"v2"'
+    assert manager.fetch(url, str(tmp_path / 'night3.jpg')) == ''
+    with open(tmp_path / 'night3.jpg', 'rb') as fp:
+        assert fp.read() == b'new image'
+    assert manager.cache.headers(url)['If-None-Match'] == '"v2"'
+    assert manager.fetch(url, str(tmp_path / 'night4.jpg')) == ''
+    with open(tmp_path / 'night4.jpg', 'rb') as fp:
+        assert fp.read() == b'new image'
+
+    # Earlier nights' files are not changed by the cache
+
+    with open(tmp_path / 'night1.jpg', 'rb') as fp:
+        assert fp.read() == b'image'
+
+
+def test_fetch_error(tmp_path):
+    manager = download.DownloadManager(retries=0)
+    assert manager.fetch('http://127.0.0.1:1/x.jpg', str(tmp_path / 'x.jpg')) != ''
+    assert not os.path.exists(tmp_path / 'x.jpg')
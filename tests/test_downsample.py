@@ -0,0 +1,53 @@
+import numpy as np
+import downsample
+
+
+def samples(count=1080):
+    rng = np.random.default_rng(0)
+    x = np.arange(count, dtype=np.float64) * 60
+    y = np.cumsum(rng.normal(0, 1, count))
+    return x, y
+
+
+def test_lttb():
+    x, y = samples()
+    keep = downsample.lttb(x, y, 100)
+
+    # The endpoints and one point per bucket, in order
+
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert (np.diff(keep) > 0).all()
+    edges = np.linspace(1, len(x) - 1, 99).astype(np.int64)
+    assert ((keep[1:-1] >= edges[:-1]) & (keep[1:-1] < edges[1:])).all()
+
+
+def test_minmax():
+    x, y = samples()
+    keep = downsample.minmax(x, y, 100)
+
+    # At most points samples, sorted, keeping every bucket's extremes
+
+    assert len(keep) <= 100
+    assert (np.diff(keep) > 0).all()
+    assert y.argmin() in keep and y.argmax() in keep
+    size = -(-len(x) // 50)
+    for start in range(0, len(x), size):
+        bucket = y[start:start + size]
+        assert start + bucket.argmin() in keep and start + bucket.argmax() in keep
+
+
+def test_downsample_arrays():
+    x, y = samples()
+    secs = x.astype(np.int64)
+
+    # 0 or too many points keeps every sample
+
+    for points in (0, len(x)):
+        kept = downsample.downsample_arrays(secs, y, points)
+        assert kept[0] is secs and kept[1] is y
+
+    for method in ('lttb', 'minmax'):
+        keptSecs, keptVals = downsample.downsample_arrays(secs, y, 100, method)
+        assert len(keptSecs) == len(keptVals) <= 100
+        assert np.isin(keptSecs, secs).all()
@@ -0,0 +1,47 @@
+import logging
+import pandas as pd
+import mkwc
+
+
+def write(tmp_path, text):
+    fileName = str(tmp_path / '20190101.mkwc.dimm.dat')
+    with open(fileName, 'w') as fp:
+        fp.write(text)
+    return fileName
+
+
+def test_read_mkwc_dat_times(tmp_path):
+    fileName = write(tmp_path, '2019 01 01 18: 01: 56 0.55\n2019 01 01 18:02:56 0.60\n2019 01 01 18 03 56 0.65\n')
+    data = mkwc.read_mkwc_dat(fileName, 'dimm')
+
+    # Each way of writing the time gives the same columns
+
+    assert list(data['minute']) == [1, 2, 3]
+    assert list(data['seeing']) == [0.55, 0.60, 0.65]
+    assert data['date'][0] == pd.Timestamp('2019-01-02 04:01:56')
+
+
+def test_read_mkwc_dat_matches_previous_reader(tmp_path):
+    fileName = mkwc.make_test_files(str(tmp_path), days=1, rows=50)[0]
+    data = mkwc.read_mkwc_dat(fileName, 'dimm')
+    previous = mkwc.read_mkwc_dat_strings(fileName, 'dimm')
+    assert (data['date'].values == previous['date'].values).all()
+    assert (data['seeing'].values == previous['seeing'].values).all()
+
+
+def test_read_mkwc_dat_bad_rows(tmp_path, caplog):
+    wide = '2019 01 01 18: 02: 56 0.60' + ' 1' * 20
+    fileName = write(tmp_path, '2019 01 01 18: 01: 56 0.55\n' + wide + '\n2019 01 01 18: 03: 56 bad\n\n2019 01 01 18: 04: 56 0.70\n')
+
+    # The wide row is skipped and logged, the row without seeing is dropped
+
+    with caplog.at_level(logging.WARNING):
+        data = mkwc.read_mkwc_dat(fileName, 'dimm', logging.getLogger('test'))
+    assert list(data['seeing']) == [0.55, 0.70]
+    assert 'skipped 1 rows' in caplog.text
+
+
+def test_read_mkwc_dat_no_data(tmp_path):
+    data = mkwc.read_mkwc_dat(write(tmp_path, 'No Data'), 'mass')
+    assert len(data) == 0
+    assert 'date' in data
@@ -0,0 +1,40 @@
+import multiprocessing
+import numpy as np
+from month_store import MonthStore
+
+
+def add_nights(storeDir, nights):
+    store = MonthStore(storeDir)
+    for night in nights:
+        with store.locked():
+            manifest = store.read_manifest()
+            store.replace(night // 100, {'night': np.full(10, night), 'value': np.arange(10.0)}, 'night')
+            manifest[str(night)] = [10, 0]
+            store.write_manifest(manifest)
+
+
+def test_replace(tmp_path):
+    store = MonthStore(str(tmp_path))
+    store.replace(202001, {'night': np.array([20200102, 20200101]), 'value': np.array([2.0, 1.0])}, 'night')
+    store.replace(202001, {'night': np.array([20200102]), 'value': np.array([3.0])}, 'night')
+
+    # Rows are sorted by night and the night's rows are replaced
+
+    columns = store.select('night', 20200101, 20200131)
+    assert list(columns['night']) == [20200101, 20200102]
+    assert list(columns['value']) == [1.0, 3.0]
+
+
+def test_concurrent_updates(tmp_path):
+    nights = [20200100 + day for day in range(1, 31)]
+    procs = [multiprocessing.Process(target=add_nights, args=(str(tmp_path), nights[i::6])) for i in range(6)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+    # No process overwrote another's nights
+
+    store = MonthStore(str(tmp_path))
+    assert list(np.unique(store.load(202001)['night'])) == nights
+    assert len(store.read_manifest()) == len(nights)
@@ -0,0 +1,83 @@
+import threading
+import time
+import pytest
+from pipeline import Stage, Pipeline
+
+
+class Recorder:
+    '''
+    Stub stages recording when each starts and ends
+    '''
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def stage(self, name, fail=False, seconds=0.01):
+        def func():
+            with self.lock:
+                self.events.append(('start', name))
+            time.sleep(seconds)
+            with self.lock:
+                self.events.append(('end', name))
+            if fail:
+                raise RuntimeError(name)
+        return func
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+def test_dependency_order():
+    r = Recorder()
+    pipeline = Pipeline([
+        Stage('setup', r.stage('setup')),
+        Stage('plots', r.stage('plots', seconds=0.1), ['setup']),
+        Stage('dimm', r.stage('dimm', seconds=0.1), ['setup']),
+        Stage('index', r.stage('index'), ['plots', 'dimm']),
+    ])
+    assert pipeline.run() == {'setup': 'ok', 'plots': 'ok', 'dimm': 'ok', 'index': 'ok'}
+
+    # Stages start after their dependencies end, independent ones overlap
+
+    assert r.index('end', 'setup') < r.index('start', 'plots')
+    assert r.index('end', 'setup') < r.index('start', 'dimm')
+    assert r.index('start', 'dimm') < r.index('end', 'plots')
+    assert r.index('start', 'index') > max(r.index('end', 'plots'), r.index('end', 'dimm'))
+    assert set(pipeline.timings) == {'setup', 'plots', 'dimm', 'index'}
+
+
+def test_failed_stage_skips_dependents():
+    r = Recorder()
+    pipeline = Pipeline([
+        Stage('setup', r.stage('setup')),
+        Stage('plots', r.stage('plots', fail=True), ['setup']),
+        Stage('dimm', r.stage('dimm'), ['setup']),
+        Stage('trends', r.stage('trends'), ['plots']),
+        Stage('index', r.stage('index'), ['trends', 'dimm']),
+    ])
+    status = pipeline.run()
+    assert status == {'setup': 'ok', 'plots': 'failed', 'dimm': 'ok', 'trends': 'skipped', 'index': 'skipped'}
+    assert ('start', 'trends') not in r.events and ('start', 'index') not in r.events
+
+
+def test_only():
+    r = Recorder()
+    pipeline = Pipeline([
+        Stage('setup', r.stage('setup')),
+        Stage('plots', r.stage('plots'), ['setup']),
+        Stage('index', r.stage('index'), ['plots']),
+    ])
+
+    # Only the named stage runs, its dependencies are not rerun
+
+    assert pipeline.run(only=['plots']) == {'plots': 'ok'}
+    assert r.events == [('start', 'plots'), ('end', 'plots')]
+
+    with pytest.raises(AssertionError):
+        pipeline.run(only=['koaxfr'])
+
+
+def test_unknown_dependency():
+    with pytest.raises(AssertionError):
+        Pipeline([Stage('index', lambda: None, ['plots'])])
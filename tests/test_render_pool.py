@@ -0,0 +1,33 @@
+import threading
+import time
+import render_pool
+
+
+def test_serial_pool_one_job_at_a_time():
+    active = []
+    overlaps = []
+
+    def job(n):
+        active.append(n)
+        if len(active) > 1:
+            overlaps.append(n)
+        time.sleep(0.01)
+        active.remove(n)
+        return n
+
+    # Jobs submitted from several threads never run together
+
+    pool = render_pool.SerialPool()
+    results = []
+    threads = [threading.Thread(target=lambda n=n: results.append(pool.submit(job, n).result())) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [0, 1, 2, 3]
+    assert overlaps == []
+
+
+def test_serial_pool_exception():
+    future = render_pool.SerialPool().submit(int, 'x')
+    assert isinstance(future.exception(), ValueError)
@@ -0,0 +1,75 @@
+import calendar
+import os
+import time
+import numpy as np
+import trend_store
+from channel_series import ChannelSeries
+from night_archive import write_night_archive
+
+NIGHTS = ['20200101', '20200102', '20200103']
+
+
+def write_nights(archiveDir):
+    '''
+    Writes a nightly archive per night and returns all values of each
+    channel
+    '''
+
+    rng = np.random.default_rng(0)
+    values = {'OutsideTemp': [], 'fwhm': []}
+    for night in NIGHTS:
+        start = calendar.timegm(time.strptime(night, '%Y%m%d'))
+        secs = start + np.arange(1080, dtype=np.int64) * 60
+        temp = rng.normal(2, 4, 1080)
+        fwhm = np.abs(rng.normal(0.7, 0.3, 1080))
+        channels = [('OutsideTemp', ChannelSeries('k0:met:tempRaw', secs, temp)), ('fwhm', ChannelSeries('k1:fwhm', secs, fwhm))]
+        write_night_archive(archiveDir + '/' + night, 1, channels)
+        values['OutsideTemp'].append(temp)
+        values['fwhm'].append(fwhm)
+    return {name: np.concatenate(vals) for name, vals in values.items()}
+
+
+def test_hist_percentiles():
+    vals = np.random.default_rng(1).normal(0, 5, 10000)
+    hist = np.bincount(trend_store.value_bins('OutsideTemp', vals), minlength=trend_store.BINS)
+    values = trend_store.hist_percentiles(hist[None, :], 'OutsideTemp')
+
+    # Within one bin of the exact percentiles
+
+    lo, hi = trend_store.RANGES['OutsideTemp']
+    width = (hi - lo) / trend_store.BINS
+    assert np.abs(values[0] - np.percentile(vals, trend_store.PERCENTILES)).max() <= width
+
+    # Rows without samples are NaN
+
+    assert np.isnan(trend_store.hist_percentiles(np.zeros((1, trend_store.BINS)), 'fwhm')).all()
+
+
+def test_update(tmp_path):
+    archiveDir = str(tmp_path)
+    values = write_nights(archiveDir)
+    store = trend_store.TrendStore(archiveDir + '/trend_store')
+    assert store.update(archiveDir) == 3
+
+    # Percentiles of the month within one bin of the samples'
+
+    for name, telNum in (('OutsideTemp', 1), ('fwhm', 1)):
+        periods, percentiles = store.period_percentiles('2020-01-01', '2020-01-31', name, telNum)
+        lo, hi = trend_store.RANGES[name]
+        assert list(periods) == [202001]
+        assert np.abs(percentiles[0] - np.percentile(values[name], trend_store.PERCENTILES)).max() <= (hi - lo) / trend_store.BINS
+
+    nights, medians = store.nightly_medians('2020-01-01', '2020-01-31', 'fwhm')
+    assert list(nights) == [int(night) for night in NIGHTS]
+    np.testing.assert_allclose(medians, [np.median(v) for v in np.split(values['fwhm'], 3)])
+
+    # Nothing changed, nothing is added
+
+    assert store.update(archiveDir) == 0
+
+    # A rewritten night replaces its rows
+
+    os.remove(archiveDir + '/20200102/nightly1/k1_archiver.npz')
+    assert store.update(archiveDir, ['2020-01-02']) == 1
+    nights, medians = store.nightly_medians('2020-01-01', '2020-01-31', 'fwhm')
+    assert list(nights) == [20200101, 20200103]
@@ -0,0 +1,136 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import update_wx_db
+
+
+class Client:
+    '''
+    Stand-in WxDbClient recording the commands sent
+    '''
+
+    def __init__(self, sent=True):
+        self.sent = sent
+        self.urls = []
+
+    def update(self, sendUrl, log_writer=''):
+        self.urls.append(sendUrl)
+        return self.sent
+
+
+def exited_pid():
+    '''
+    Returns the pid of a process that has exited
+    '''
+
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_unsent_commands_are_replayed(tmp_path):
+    spoolFile = str(tmp_path / 'wxdb.spool')
+    failing = update_wx_db.WxDbQueue(spoolFile, client=Client(sent=False))
+    failing.start()
+    failing.put('cmd=updateWxDb&utdate=2020-01-01&column=a&value=1')
+    failing.put('cmd=updateWxDb&utdate=2020-01-01&column=b&value=2')
+    failing.stop()
+    assert len(failing.read_spool()) == 2
+
+    # Left by a process that has exited, so the next start() replays it
+
+    os.rename(failing.spoolFile, '{}.{}'.format(spoolFile, exited_pid()))
+    client = Client()
+    spool = update_wx_db.WxDbQueue(spoolFile, client=client)
+    spool.start()
+    spool.stop()
+    assert client.urls == ['cmd=updateWxDb&utdate=2020-01-01&column=a&value=1', 'cmd=updateWxDb&utdate=2020-01-01&column=b&value=2']
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_running_process_spool_is_not_replayed(tmp_path):
+    spoolFile = str(tmp_path / 'wxdb.spool')
+    liveFile = '{}.{}'.format(spoolFile, os.getppid())
+    with open(liveFile, 'w') as fp:
+        fp.write('P\tid\tcmd=updateWxDb\n')
+
+    client = Client()
+    spool = update_wx_db.WxDbQueue(spoolFile, client=client)
+    spool.start()
+    spool.stop()
+    assert client.urls == []
+    assert os.listdir(str(tmp_path)) == [os.path.basename(liveFile)]
+
+
+def test_failed_start_leaves_no_queue(tmp_path, monkeypatch):
+    def start(self):
+        raise OSError('spool not writable')
+
+    monkeypatch.setattr(update_wx_db.WxDbQueue, 'start', start)
+    with pytest.raises(OSError):
+        update_wx_db.start_queue(spoolFile=str(tmp_path / 'wxdb.spool'))
+    assert update_wx_db.spool is None
+    update_wx_db.stop_queue()
+
+    # A queue that never started stops without error
+
+    update_wx_db.WxDbQueue(str(tmp_path / 'wxdb.spool')).stop()
+
+
+def test_synchronous_update_does_not_retry(monkeypatch):
+    monkeypatch.setattr(os, 'getlogin', lambda: 'test')
+    monkeypatch.setattr(update_wx_db, 'client', update_wx_db.WxDbClient('http://127.0.0.1:1/koa?'))
+    sleeps = []
+    monkeypatch.setattr(update_wx_db.time, 'sleep', sleeps.append)
+
+    # An unreachable API fails at once without the queue
+
+    assert update_wx_db.spool is None
+    assert not update_wx_db.updateWxDb('cmd=updateWxDb&utdate=2020-01-01&column=a&value=1')
+    assert sleeps == []
+
+    # The background queue's client still backs off
+
+    assert not update_wx_db.client.update('cmd=updateWxDb', retries=2)
+    assert sleeps == [update_wx_db.BACKOFF, 2 * update_wx_db.BACKOFF]
+
+
+class SlowClient(Client):
+    '''
+    Stand-in client that waits for release before sending
+    '''
+
+    def __init__(self):
+        Client.__init__(self)
+        self.release = threading.Event()
+
+    def update(self, sendUrl, log_writer=''):
+        self.release.wait()
+        return Client.update(self, sendUrl, log_writer)
+
+
+def test_restart_while_sending(tmp_path):
+    spoolFile = str(tmp_path / 'wxdb.spool')
+    slow = SlowClient()
+    first = update_wx_db.WxDbQueue(spoolFile, client=slow)
+    first.start()
+    first.put('cmd=a')
+    first.put('cmd=b')
+    first.stop(timeout=0.05)
+    assert first.thread.is_alive()
+
+    # The next night in this process leaves the first queue's entries to it
+
+    client = Client()
+    second = update_wx_db.WxDbQueue(spoolFile, client=client)
+    second.start()
+    second.put('cmd=c')
+    slow.release.set()
+    first.thread.join()
+    second.stop()
+
+    assert slow.urls == ['cmd=a', 'cmd=b']
+    assert client.urls == ['cmd=c']
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,423 @@
+#---------------------------------------------------------------
+#
+# Long-range weather and FWHM trends built from the nightly
+# archiver files (see night_archive.py).  Each night is reduced
+# once to per UT hour histograms and a nightly median, stored by
+# month (see month_store.py), so monthly and yearly summaries
+# over any number of years are sums of stored rows and need no
+# archiver queries.
+#
+# Usage: trend_store.py archiveDir [YYYY-MM-DD YYYY-MM-DD] [-period month|year] [-plot outDir]
+#
+# Adds the nights under archiveDir that are new or changed, then
+# prints the percentiles of each trend per month or year for the
+# period and writes outDir/wx_trends.html if -plot is given.
+#
+#---------------------------------------------------------------
+
+import configparser
+import os
+import sys
+import time
+import numpy as np
+from month_store import MonthStore, night_int
+from night_archive import read_night_archive
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Channels summarized, stored as their position in this list, with the
+# histogram range of each.  Values outside the range count in the first
+# or last bin.
+
+CHANNELS = ['OutsideTemp', 'OutsideHumidity', 'Dewpoint', 'fwhm']
+RANGES = {
+    'OutsideTemp': (-20.0, 20.0),
+    'OutsideHumidity': (0.0, 100.0),
+    'Dewpoint': (-40.0, 20.0),
+    'fwhm': (0.0, 4.0),
+}
+
+# Channels measured once for the site (k0), stored as telescope 0
+
+SITE_CHANNELS = ['OutsideTemp', 'OutsideHumidity', 'Dewpoint']
+
+# Histogram bins per hour, percentiles are interpolated within a bin
+
+BINS = 200
+
+# Default percentiles returned by the queries
+
+PERCENTILES = (10, 50, 90)
+
+def get_trend_dir(archiveDir):
+    '''
+    Returns the trend store directory, TRENDSTORE in the API section of
+    config.live.ini (default is archiveDir/trend_store)
+    '''
+
+    config = configparser.ConfigParser()
+    config.read(dir_path+'/config.live.ini')
+    return config.get('API', 'TRENDSTORE', fallback=archiveDir+'/trend_store')
+
+
+def value_bins(name, vals):
+    '''
+    Returns the histogram bin of each value of the channel
+    '''
+
+    lo, hi = RANGES[name]
+    bins = np.floor((vals - lo) * (BINS / (hi - lo))).astype(np.int64)
+    return np.clip(bins, 0, BINS - 1)
+
+
+def hist_percentiles(hist, name, percentiles=PERCENTILES):
+    '''
+    Returns the percentiles of each row of histograms of the channel,
+    an array of rows by percentiles.  Rows without samples are NaN.
+
+    @type hist: numpy array
+    @param hist: counts, rows by BINS
+    @type name: string
+    @param name: channel name, one of CHANNELS
+    '''
+
+    lo, hi = RANGES[name]
+    width = (hi - lo) / BINS
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1]
+    rows = np.arange(len(hist))
+
+    values = np.full((len(hist), len(percentiles)), np.nan)
+    for key, percentile in enumerate(percentiles):
+        target = total * (percentile / 100.0)
+        index = np.minimum((cum < target[:, None]).sum(axis=1), BINS - 1)
+        before = np.where(index > 0, cum[rows, index - 1], 0)
+        count = hist[rows, index]
+        frac = np.where(count > 0, (target - before) / np.maximum(count, 1), 0.5)
+        values[:, key] = lo + width * (index + frac)
+    values[total == 0] = np.nan
+    return values
+
+
+class TrendStore:
+    '''
+    Nightly summaries of the CHANNELS for every ingested night.  The
+    hourly store has night (YYYYMMDD), tel, channel (index in CHANNELS),
+    hour (UT) and hist (BINS counts) columns, the nightly store has
+    night, tel, channel, count and median columns.
+
+    @type trendDir: string
+    @param trendDir: directory holding the store
+    '''
+
+    def __init__(self, trendDir):
+        self.hourly = MonthStore(trendDir + '/hourly')
+        self.nightly = MonthStore(trendDir + '/nightly')
+
+    def update(self, archiveDir, nights=None, log_writer=''):
+        '''
+        Adds the nightly archiver files of the nights under archiveDir
+        that are new or changed since the last update.  Returns the
+        number of nights added.
+
+        @type archiveDir: string
+        @param archiveDir: directory holding the YYYYMMDD night directories
+        @type nights: list
+        @param nights: only check these UT dates (default is all)
+        '''
+
+        # Summarize each changed night and replace its rows in its month,
+        # other nights are not read again.  The manifest is kept in the
+        # hourly store.
+
+        def ingest(month, monthNights, files):
+            parts = [self.read_night(archiveDir, night, files[night], log_writer) for night in monthNights]
+            for store, key in ((self.hourly, 0), (self.nightly, 1)):
+                columns = {name: np.concatenate([part[key][name] for part in parts]) for name in parts[0][key]}
+                store.replace(month, columns, 'night', monthNights)
+
+        changed = self.hourly.update_nights(archiveDir, 'nightly[12]/k[12]_archiver.npz', ingest, nights)
+
+        if log_writer:
+            log_writer.info('trend_store.py added {} nights'.format(changed))
+
+        return changed
+
+    def read_night(self, archiveDir, night, files, log_writer=''):
+        '''
+        Returns the (hourly, nightly) columns for one night's archiver
+        files
+        '''
+
+        hourly = {'night': [], 'tel': [], 'channel': [], 'hour': [], 'hist': []}
+        nightly = {'night': [], 'tel': [], 'channel': [], 'count': [], 'median': []}
+        seen = set()
+        for file in sorted(files):
+            telNum = int(os.path.basename(file)[1])
+            try:
+                series = read_night_archive(archiveDir + '/' + file)
+            except Exception as e:
+                if log_writer:
+                    log_writer.warning('trend_store.py unable to read {} ({})'.format(file, e))
+                continue
+
+            for channel, name in enumerate(CHANNELS):
+                tel = 0 if name in SITE_CHANNELS else telNum
+                if name not in series or (tel, channel) in seen:
+                    continue
+                seen.add((tel, channel))
+                s = series[name]
+                keep = np.isfinite(s.vals)
+                secs = s.secs[keep]
+                vals = s.vals[keep]
+                if len(vals) == 0:
+                    continue
+
+                # Counts per UT hour and bin in one pass
+
+                hours = (secs // 3600) % 24
+                hist = np.bincount(hours * BINS + value_bins(name, vals), minlength=24*BINS)
+                hist = hist.reshape(24, BINS).astype(np.uint32)
+                used = np.flatnonzero(hist.sum(axis=1))
+
+                hourly['night'].append(np.full(len(used), night, dtype=np.int32))
+                hourly['tel'].append(np.full(len(used), tel, dtype=np.int8))
+                hourly['channel'].append(np.full(len(used), channel, dtype=np.int8))
+                hourly['hour'].append(used.astype(np.int8))
+                hourly['hist'].append(hist[used])
+
+                nightly['night'].append(night)
+                nightly['tel'].append(tel)
+                nightly['channel'].append(channel)
+                nightly['count'].append(len(vals))
+                nightly['median'].append(np.median(vals))
+
+        # A night with no readable files still replaces its old rows
+
+        dtypes = {'night': np.int32, 'tel': np.int8, 'channel': np.int8, 'hour': np.int8}
+        if hourly['hist']:
+            hourly = {name: np.concatenate(parts) for name, parts in hourly.items()}
+        else:
+            hourly = {name: np.array([], dtype=dtype) for name, dtype in dtypes.items()}
+            hourly['hist'] = np.zeros((0, BINS), dtype=np.uint32)
+
+        dtypes.pop('hour')
+        dtypes.update({'count': np.int32, 'median': np.float64})
+        nightly = {name: np.array(nightly[name], dtype=dtype) for name, dtype in dtypes.items()}
+
+        return hourly, nightly
+
+    def select(self, store, startDate, endDate, name, telNum):
+        '''
+        Returns the rows of store for the channel from startDate to
+        endDate (inclusive)
+        '''
+
+        tel = 0 if name in SITE_CHANNELS else telNum
+        columns = store.select('night', night_int(startDate), night_int(endDate))
+        if not columns:
+            return {}
+        mask = (columns['tel'] == tel) & (columns['channel'] == CHANNELS.index(name))
+        return {key: col[mask] for key, col in columns.items()}
+
+    def period_hists(self, startDate, endDate, name, telNum=1, period='month'):
+        '''
+        Returns (periods, hist), the months (YYYYMM) or years (YYYY) with
+        data and the summed histograms, periods by 24 UT hours by BINS
+        '''
+
+        columns = self.select(self.hourly, startDate, endDate, name, telNum)
+        if not columns or len(columns['night']) == 0:
+            return np.array([], dtype=np.int64), np.zeros((0, 24, BINS), dtype=np.int64)
+
+        keys = columns['night'] // (10000 if period == 'year' else 100)
+        periods = np.unique(keys)
+
+        # Sum the rows of each period and hour with one reduceat
+
+        groups = np.searchsorted(periods, keys) * 24 + columns['hour']
+        order = np.argsort(groups, kind='stable')
+        groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        sums = np.add.reduceat(columns['hist'][order].astype(np.int64), starts, axis=0)
+
+        hist = np.zeros((len(periods) * 24, BINS), dtype=np.int64)
+        hist[groups[starts]] = sums
+        return periods, hist.reshape(len(periods), 24, BINS)
+
+    def hourly_percentiles(self, startDate, endDate, name, telNum=1, period='month', percentiles=PERCENTILES):
+        '''
+        Returns (periods, values), the months (YYYYMM) or years (YYYY)
+        with data and the percentiles per UT hour, periods by 24 hours by
+        percentiles (NaN for hours without data)
+
+        @type startDate: string
+        @param startDate: first UT date (YYYY-MM-DD)
+        @type endDate: string
+        @param endDate: last UT date (YYYY-MM-DD)
+        @type name: string
+        @param name: channel name, one of CHANNELS
+        @type telNum: int
+        @param telNum: telescope number (1 or 2), ignored for site channels
+        @type period: string
+        @param period: month (default) or year
+        '''
+
+        periods, hist = self.period_hists(startDate, endDate, name, telNum, period)
+        values = hist_percentiles(hist.reshape(-1, BINS), name, percentiles)
+        return periods, values.reshape(len(periods), 24, len(percentiles))
+
+    def period_percentiles(self, startDate, endDate, name, telNum=1, period='month', percentiles=PERCENTILES):
+        '''
+        Returns (periods, values), the months (YYYYMM) or years (YYYY)
+        with data and the percentiles over all hours, periods by
+        percentiles
+        '''
+
+        periods, hist = self.period_hists(startDate, endDate, name, telNum, period)
+        return periods, hist_percentiles(hist.sum(axis=1), name, percentiles)
+
+    def nightly_medians(self, startDate, endDate, name, telNum=1):
+        '''
+        Returns (nights, medians), the nights (YYYYMMDD) with data from
+        startDate to endDate and the median of each
+        '''
+
+        columns = self.select(self.nightly, startDate, endDate, name, telNum)
+        if not columns:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+        return columns['night'], columns['median']
+
+
+def date_secs(dates):
+    '''
+    Returns YYYYMMDD, YYYYMM or YYYY ints as UT epoch seconds of the
+    first day
+    '''
+
+    dates = np.asarray(dates, dtype=np.int64)
+    if len(dates) and dates.max() < 10000:
+        dates = dates * 10000 + 101
+    elif len(dates) and dates.max() < 1000000:
+        dates = dates * 100 + 1
+    days = np.array(['{:04d}-{:02d}-{:02d}'.format(d // 10000, d // 100 % 100, d % 100) for d in dates], dtype='datetime64[D]')
+    return days.astype('datetime64[s]').astype(np.int64)
+
+
+# Trend plots: channel, telescopes, y axis label
+
+TRENDS = [
+    ('OutsideTemp', [1], 'Temperature (C)'),
+    ('OutsideHumidity', [1], 'Humidity (%)'),
+    ('Dewpoint', [1], 'Dewpoint (C)'),
+    ('fwhm', [1, 2], 'FWHM (arcseconds)'),
+]
+
+COLORS = ['steelblue', 'orange', 'green', 'red', 'purple', 'brown', 'gray', 'olive']
+
+def make_trend_plots(store, outDir, startDate, endDate, period='month', log_writer=''):
+    '''
+    Writes outDir/wx_trends.html with, for each trend, the nightly
+    medians, the 10/50/90 percentiles per period and the median per
+    UT hour of each period.  Reads only the store.
+
+    @type store: TrendStore
+    @param store: store to read
+    @type outDir: string
+    @param outDir: directory to write to
+    @type period: string
+    @param period: month (default) or year
+    '''
+
+    from bokeh.embed import file_html
+    from bokeh.layouts import gridplot
+    from bokeh.resources import CDN
+    from bokeh_plots import curve_figure, scatter_figure
+
+    rows = []
+    for name, telNums, yLabel in TRENDS:
+        medians = []
+        percentiles = []
+        hourly = []
+        for telNum in telNums:
+            label = name if len(telNums) == 1 else 'K{} {}'.format(telNum, name)
+            nights, values = store.nightly_medians(startDate, endDate, name, telNum)
+            medians.append((date_secs(nights), values, label, COLORS[len(medians)]))
+
+            periods, values = store.period_percentiles(startDate, endDate, name, telNum, period)
+            for key, percentile in enumerate(PERCENTILES):
+                color = COLORS[len(percentiles) % len(COLORS)]
+                percentiles.append((date_secs(periods), values[:, key], '{} {}%'.format(label, percentile), color))
+
+            # Hours are plotted as times on 1970-01-01 so the axis reads
+            # HH:MM, with a line for each of the latest periods
+
+            periods, values = store.hourly_percentiles(startDate, endDate, name, telNum, period, (50,))
+            hours = np.arange(24, dtype=np.int64) * 3600
+            latest = slice(max(0, len(periods) - len(COLORS)), None)
+            for p, v in zip(periods[latest], values[latest, :, 0]):
+                hourly.append((hours, v, '{} {}'.format(label, p), COLORS[len(hourly) % len(COLORS)]))
+
+        row = []
+        row.append(scatter_figure(medians, 'Nightly median ' + yLabel, 450, 300, size=3))
+        row.append(curve_figure(percentiles, yLabel + ' per ' + period, 450, 300))
+        row.append(curve_figure(hourly, 'Median ' + yLabel + ' by UT hour', 450, 300))
+        rows.append(row)
+
+    joinSeq = (outDir, '/wx_trends.html')
+    file = ''.join(joinSeq)
+    with open(file, 'w') as fp:
+        fp.write(file_html(gridplot(rows), CDN, 'Weather trends {} to {}'.format(startDate, endDate)))
+
+    if log_writer:
+        log_writer.info('trend_store.py file saved {}'.format(file))
+    return file
+
+
+def main():
+    '''
+    Updates the store and prints or plots the trends for the command
+    line arguments
+    '''
+
+    args = sys.argv[1:]
+    assert args, 'Usage: trend_store.py archiveDir [YYYY-MM-DD YYYY-MM-DD] [-period month|year] [-plot outDir]'
+
+    period = 'month'
+    if '-period' in args:
+        i = args.index('-period')
+        period = args[i+1]
+        del args[i:i+2]
+    outDir = ''
+    if '-plot' in args:
+        i = args.index('-plot')
+        outDir = args[i+1]
+        del args[i:i+2]
+
+    archiveDir = args[0]
+    store = TrendStore(get_trend_dir(archiveDir))
+    start = time.time()
+    print('Added {} nights ({:.1f} s)'.format(store.update(archiveDir), time.time() - start))
+
+    if len(args) < 3:
+        return
+    startDate = args[1]
+    endDate = args[2]
+
+    for name, telNums, yLabel in TRENDS:
+        for telNum in telNums:
+            periods, values = store.period_percentiles(startDate, endDate, name, telNum, period)
+            print('')
+            print('{} K{}'.format(name, telNum) if name not in SITE_CHANNELS else name)
+            for p, v in zip(periods, values):
+                print('{:>8}  '.format(p) + '  '.join(['{:>4}% {:8.2f}'.format(k, x) for k, x in zip(PERCENTILES, v)]))
+
+    if outDir:
+        start = time.time()
+        file = make_trend_plots(store, outDir, startDate, endDate, period)
+        print('')
+        print('Wrote {} ({:.1f} s)'.format(file, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,365 @@
 import os
+import glob
 import hashlib
-import urllib.request
-import json
+import queue
+import tempfile
+import threading
+import time
+import uuid
 import configparser
+import requests
+from requests.adapters import HTTPAdapter
+
+# Retries and first backoff delay (seconds, doubled per retry) for
+# commands sent from the background queue
+
+MAX_RETRIES = 3
+BACKOFF = 1.0
+
+class WxDbClient:
+    """
+    Sends koawx update commands over a pooled keep-alive connection.
+    The configuration and user hash are loaded once.
+
+    @param url: KOA API URL (default is from config.live.ini)
+    @type url: string
+    @param timeout: seconds to wait for each request
+    @type timeout: float
+    """
+
+    def __init__(self, url='', timeout=30):
+
+        # Database access URL
+
+        if not url:
+            dir_path = os.path.dirname(os.path.realpath(__file__))
+            config = configparser.ConfigParser()
+            config.read(dir_path+'/config.live.ini')
+            url = config['API']['KOAAPI']
+
+        user = os.getlogin()
+        self.url = url
+        self.hash = hashlib.md5(user.encode('utf-8')).hexdigest()
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=4))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=4))
+
+    def update(self, sendUrl, log_writer='', retries=MAX_RETRIES):
+        """
+        Sends one command, retrying with backoff.  Returns True if sent.
+
+        @param sendUrl: command and field to update
+        @type sendUrl: string
+        @param log_writer: logger
+        @type log_writer: logging
+        """
+
+        sendUrl = ''.join((self.url, sendUrl, '&hash=', self.hash))
+
+        if log_writer:
+            log_writer.info('weather.py {}'.format(sendUrl))
+
+        delay = BACKOFF
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.get(sendUrl, timeout=self.timeout)
+                response.raise_for_status()
+                return True
+            except requests.RequestException as e:
+                error = e
+            if attempt < retries:
+                time.sleep(delay)
+                delay *= 2
+
+        if log_writer:
+            log_writer.warning('weather.py could not update koawx database table ({})'.format(error))
+        return False
+
+
+class WxDbQueue:
+    """
+    Sends koawx update commands from a background thread.  Each command
+    is appended to a spool journal before it is queued and marked done
+    once sent, so commands not sent when the process exits are replayed
+    by the next start().
+
+    Each process writes its own journal, spoolFile.pid, so concurrent
+    runs (e.g. backfill workers) never write the same file.  start()
+    only takes over the journals of processes that have exited, and
+    leaves this process's journal to an earlier queue still sending
+    from it.
+
+    @param spoolFile: journal file prefix
+    @type spoolFile: string
+    @param client: client used to send (default is the shared client)
+    @type client: WxDbClient
+    """
+
+    # Background threads of the queues started on each journal
+
+    threads = {}
+
+    def __init__(self, spoolFile, client=None, log_writer=''):
+        self.spoolBase = spoolFile
+        self.spoolFile = '.'.join((spoolFile, str(os.getpid())))
+        self.client = client
+        self.log_writer = log_writer
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """
+        Takes over the journals left by exited processes, compacts them
+        into this process's journal, queues their unsent commands and
+        starts the background thread
+        """
+
+        # An earlier queue in this process whose stop() timed out is
+        # still sending the entries of this process's journal
+
+        threads = [t for t in WxDbQueue.threads.get(self.spoolFile, []) if t.is_alive()]
+        busy = len(threads) > 0
+
+        # Claim each journal by renaming it, so only one process replays it
+
+        claimed = []
+        for file in self.stale_spools():
+            if file == self.spoolFile:
+                if not busy:
+                    claimed.append(file)
+                continue
+            claimFile = '.'.join((self.spoolFile, uuid.uuid4().hex))
+            try:
+                os.rename(file, claimFile)
+            except OSError:
+                continue
+            claimed.append(claimFile)
+
+        # This process's journal last, it may mark claimed entries done
+
+        claimed.sort(key=lambda file: file == self.spoolFile)
+        pending = self.read_spool(claimed)
+
+        # Compact into this process's journal, or add to it while the
+        # earlier queue is still using it
+
+        spoolDir, spoolName = os.path.split(os.path.abspath(self.spoolBase))
+        with self.lock:
+            if busy:
+                fd = os.open(self.spoolFile, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            else:
+                fd, tmpFile = tempfile.mkstemp(dir=spoolDir, prefix=spoolName + '.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                for id, sendUrl in pending:
+                    fp.write('\t'.join(('P', id, sendUrl)) + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+            if not busy:
+                os.replace(tmpFile, self.spoolFile)
+            for file in claimed:
+                if file != self.spoolFile:
+                    os.remove(file)
+
+        if pending and self.log_writer:
+            self.log_writer.info('update_wx_db.py replaying {} spooled updates'.format(len(pending)))
+        for id, sendUrl in pending:
+            self.queue.put((id, sendUrl, self.log_writer))
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        WxDbQueue.threads[self.spoolFile] = threads + [self.thread]
+
+    def stale_spools(self):
+        """
+        Returns the journals whose process has exited, including this
+        process's own journal and an unsuffixed journal from older runs
+        """
+
+        files = []
+        if os.path.isfile(self.spoolBase):
+            files.append(self.spoolBase)
+        for file in glob.glob(glob.escape(self.spoolBase) + '.*'):
+            pid = file[len(self.spoolBase) + 1:].split('.')[0]
+            if not pid.isdigit():
+                continue
+            if int(pid) == os.getpid() or not is_running(int(pid)):
+                files.append(file)
+        return files
+
+    def read_spool(self, files=None):
+        """
+        Returns the (id, sendUrl) journal entries not marked done
+
+        @param files: journals to read in order (default is this process's journal)
+        @type files: list
+        """
+
+        if files is None:
+            files = [self.spoolFile]
+
+        pending = {}
+        for file in files:
+            try:
+                with open(file, 'r') as fp:
+                    for line in fp:
+                        fields = line.rstrip('\n').split('\t')
+                        if fields[0] == 'P' and len(fields) == 3:
+                            pending[fields[1]] = fields[2]
+                        elif fields[0] == 'D' and len(fields) == 2:
+                            pending.pop(fields[1], None)
+            except OSError:
+                pass
+        return list(pending.items())
+
+    def append(self, *fields):
+        """
+        Appends one line to the journal and syncs it to disk
+        """
+
+        with self.lock:
+            with open(self.spoolFile, 'a') as fp:
+                fp.write('\t'.join(fields) + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+
+    def put(self, sendUrl, log_writer=''):
+        """
+        Spools a command and queues it for the background thread
+
+        @param sendUrl: command and field to update
+        @type sendUrl: string
+        @param log_writer: logger
+        @type log_writer: logging
+        """
+
+        id = uuid.uuid4().hex
+        self.append('P', id, sendUrl)
+        self.queue.put((id, sendUrl, log_writer))
+
+    def run(self):
+        """
+        Background thread, sends queued commands in order
+        """
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            id, sendUrl, log_writer = item
+            try:
+                if self.client is None:
+                    self.client = get_client()
+                sent = self.client.update(sendUrl, log_writer)
+            except Exception as e:
+                sent = False
+                if log_writer:
+                    log_writer.warning('update_wx_db.py could not send {} ({})'.format(sendUrl, e))
+            if sent:
+                self.append('D', id)
+            self.queue.task_done()
+
+    def stop(self, timeout=None):
+        """
+        Waits up to timeout seconds for queued commands to be sent and
+        stops the background thread.  Unsent commands stay in the journal,
+        which is removed once empty.
+        """
+
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+        # Nothing is left to replay once every command was sent
+
+        if not self.thread.is_alive():
+            with self.lock:
+                if not self.read_spool():
+                    try:
+                        os.remove(self.spoolFile)
+                    except OSError:
+                        pass
+
+
+# Client shared by all updateWxDb calls in this process, and the
+# background queue when one is running
+
+client = None
+clientLock = threading.Lock()
+spool = None
+
+def get_client():
+    """
+    Returns the shared WxDbClient, creating it on first use
+    """
+
+    global client
+    with clientLock:
+        if client is None:
+            client = WxDbClient()
+    return client
+
+
+def is_running(pid):
+    """
+    Returns True if the process pid is running
+    """
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def start_queue(log_writer='', spoolFile=''):
+    """
+    Starts sending updateWxDb commands from a background thread,
+    first replaying commands left in the spool by an earlier run
+
+    @param spoolFile: journal file prefix (default is WXDBSPOOL in config.live.ini)
+    @type spoolFile: string
+    """
+
+    global spool
+
+    if not spoolFile:
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        config = configparser.ConfigParser()
+        config.read(dir_path+'/config.live.ini')
+        spoolFile = config.get('API', 'WXDBSPOOL', fallback=dir_path+'/wxdb.spool')
+
+    # Only use the queue once it has started
+
+    newSpool = WxDbQueue(spoolFile, log_writer=log_writer)
+    newSpool.start()
+    spool = newSpool
+
+
+def stop_queue(timeout=None):
+    """
+    Waits up to timeout seconds for the background thread to send the
+    queued commands, then goes back to sending synchronously
+    """
+
+    global spool
+
+    if spool is not None:
+        spool.stop(timeout)
+        spool = None
+
 
 def updateWxDb(sendUrl, log_writer=''):
     """
-    Sends command to update KOA data
+    Sends command to update KOA data.  If start_queue() was called the
+    command is spooled and sent in the background, with retries.
+    Otherwise it is sent once so the caller never waits on backoff.
 
     @param sendUrl: command and field to update
     @type sendUrl: string
@@ -14,21 +367,8 @@ def updateWxDb(sendUrl, log_writer=''):
     @type log_writer: logging
     """
 
-    user = os.getlogin()
-
-    # Database access URL
-
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    config = configparser.ConfigParser()
-    config.read(dir_path+'/config.live.ini')
-    url = config['API']['KOAAPI']
-
-    myHash = hashlib.md5(user.encode('utf-8')).hexdigest()
-    sendUrl = ''.join((url, sendUrl, '&hash=', myHash))
-
-    if log_writer:
-        log_writer.info('weather.py {}'.format(sendUrl))
+    if spool is not None:
+        spool.put(sendUrl, log_writer)
+        return True
 
-    data = urllib.request.urlopen(sendUrl)
-    if data == False:
-        log_writer.warning('weather.py could not update koawx database table')
+    return get_client().update(sendUrl, log_writer, retries=0)
@@ -4,12 +4,20 @@
 # various sources.  This information is archived in KOA for
 # users to view at any time.
 #
-# Usage: weather.py wxDir [YYYY-MM-DD]
+# Usage: weather.py wxDir [YYYY-MM-DD] [-nodb] [-nocache] [-notext] [-stage name]
 #
 # @param wxDir: output directory location
 # @type wxDir: string
 # @param YYYY-MM-DD: UT date
 # @type YYYY-MM-DD: string
+# @param -nodb: do not update the koawx database table
+# @param -nocache: bypass the local archiver cache
+# @param -notext: only write the columnar archiver files, not the .txt dumps
+# @param -stage name: only rerun the named stage (can be repeated)
+#
+# Stages are setup, make_nightly_plots, skyprobe, get_dimm_data,
+# seeing_index, trend_store, index, checksum and koaxfr.  Stages run as soon
+# as the stages they depend on complete.
 #
 # Log is wxDir/weather_utDate.log
 #
@@ -27,19 +35,18 @@ import verification
 import logging as lg
 from datetime import datetime
 from sys import argv
-import subprocess as sp
-import weather_nightly as wn
 import make_nightly_plots as mn
 import os
 from shutil import copyfile
 import skyprobe as sky
 import get_dimm_data as dimm
-import hashlib
-import urllib.request
-import json
+import checksum
+import seeing_index
+import trend_store
 import update_wx_db as wxdb
 import koaxfr
 import configparser
+from pipeline import Stage, Pipeline
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 config = configparser.ConfigParser()
@@ -47,225 +54,393 @@ config.read(dir_path+'/config.live.ini')
 emailFrom = config['KOAXFR']['EMAILFROM']
 emailError = config['KOAXFR']['EMAILERROR']
 
-# Default UT date is today
-# Runs at 2pm, so use now()
+# Seconds to wait at the end of the run for spooled koawx updates
 
-utDate = datetime.now().strftime('%Y-%m-%d')
-dbUpdate = 1
+DB_TIMEOUT = 300
 
-# Usage can have 0 or 1 additional arguments
+def weather(wxDir, utDate, dbUpdate=1, useCache=True, sendEmail=True, stages=None, writeText=True):
+    '''
+    Gathers the nightly weather products for utDate into wxDir/YYYYMMDD.
+    Returns the number of errors logged.
 
-assert len(argv) >= 2, 'Usage: weather.py wxDir [YYYY-MM-DD] [-nodb]'
+    @type wxDir: string
+    @param wxDir: output directory location
+    @type utDate: string
+    @param utDate: UT date (YYYY-MM-DD)
+    @type dbUpdate: int
+    @param dbUpdate: update the koawx database table (default is 1)
+    @type useCache: bool
+    @param useCache: use the local archiver cache (default is True)
+    @type sendEmail: bool
+    @param sendEmail: email the log contents when done (default is True)
+    @type stages: list
+    @param stages: names of the stages to rerun (default is all)
+    @type writeText: bool
+    @param writeText: write the archiver channels to .txt files (default is True)
+    '''
 
-# Parse UT date from argument list
+    # Verify date, will exit if verification fails
 
-if len(argv) >= 2:
-    wxDir = argv[1]
-    if len(argv) >= 3:
-        utDate = argv[2].replace('/', '-')
-    if len(argv) == 4:
-        dbUpdate = 0
+    verification.verify_date(utDate)
 
-# Verify date, will exit if verification fails
+    # Setup logging
 
-verification.verify_date(utDate)
+    user = os.getlogin()
+    joinSeq = ('weather <', user, '>')
+    writerName = ''.join(joinSeq)
+    log_writer = lg.getLogger(writerName)
+    log_writer.setLevel(lg.INFO)
 
-# Setup logging
+    # Crete a file handler
 
-user = os.getlogin()
-joinSeq = ('weather <', user, '>')
-writerName = ''.join(joinSeq)
-log_writer = lg.getLogger(writerName)
-log_writer.setLevel(lg.INFO)
+    joinSeq = (wxDir, '/weather_', utDate.replace('-', ''), '.log')
+    logFile = ''.join(joinSeq)
+    log_handler = lg.FileHandler(logFile)
+    log_handler.setLevel(lg.INFO)
 
-# Crete a file handler
+    # Create a logging format
 
-joinSeq = (wxDir, '/weather_', utDate.replace('-', ''), '.log')
-logFile = ''.join(joinSeq)
-log_handler = lg.FileHandler(logFile)
-log_handler.setLevel(lg.INFO)
+    formatter = lg.Formatter('%(asctime)s - %(name)s - %(levelname)s: %(message)s')
+    log_handler.setFormatter(formatter)
 
-# Create a logging format
+    # Add handlers to the logger
 
-formatter = lg.Formatter('%(asctime)s - %(name)s - %(levelname)s: %(message)s')
-log_handler.setFormatter(formatter)
+    log_writer.addHandler(log_handler)
 
-# Add handlers to the logger
+    log_writer.info('weather.py started for {}'.format(utDate))
 
-log_writer.addHandler(log_handler)
+    # Run the stages with koawx updates spooled and sent in the background,
+    # then remove the handler so each night has its own log
 
-log_writer.info('weather.py started for {}'.format(utDate))
+    try:
+        if dbUpdate:
+            wxdb.start_queue(log_writer)
+        pipeline = night_pipeline(wxDir, utDate, dbUpdate, useCache, logFile, log_writer, writeText)
+        pipeline.run(stages)
+        log_writer.info('weather.py complete for {}'.format(utDate))
+    finally:
+        wxdb.stop_queue(DB_TIMEOUT)
+        log_writer.removeHandler(log_handler)
+        log_handler.close()
+
+    # Send log contents
+
+    subject = ' '.join(('WEATHER',utDate))
+    message = ''
+    error = 0
+    errorString = ''
+    with open(logFile, 'r') as fp:
+        for line in fp:
+            if 'ERROR:' in line:
+                errorString = f'{errorString}{line}'
+                error += 1
+            message = ''.join((message, line))
+
+    message = ''.join((str(error), ' errors\n\n', errorString, '\n\n', message))
+    if message and sendEmail:
+        koaxfr.send_email(emailError, emailFrom, subject, message, log_writer)
+
+    return error
+
+
+def night_pipeline(wxDir, utDate, dbUpdate, useCache, logFile, log_writer, writeText=True):
+    '''
+    Returns the Pipeline of stages that create the nightly weather
+    products
+
+    @type logFile: string
+    @param logFile: log file for this night, referenced in wx.LOC
+    '''
+
+    # Settings shared by the stages
+
+    night = {}
+    night['archiveDir'] = wxDir
+    night['wxDir'] = ''.join((wxDir, '/', utDate.replace('-', '')))
+    night['utDate'] = utDate
+    night['dbUpdate'] = dbUpdate
+    night['useCache'] = useCache
+    night['writeText'] = writeText
+    night['logFile'] = logFile
+    night['locFile'] = ''.join((night['wxDir'], '/wx.LOC'))
+    night['log_writer'] = log_writer
+
+    stages = []
+    stages.append(Stage('setup', lambda: setup_stage(night)))
+    stages.append(Stage('make_nightly_plots', lambda: plots_stage(night), ['setup']))
+    stages.append(Stage('skyprobe', lambda: skyprobe_stage(night), ['setup']))
+    stages.append(Stage('get_dimm_data', lambda: dimm_stage(night), ['setup']))
+    stages.append(Stage('seeing_index', lambda: seeing_index_stage(night), ['get_dimm_data']))
+    stages.append(Stage('trend_store', lambda: trend_store_stage(night), ['make_nightly_plots']))
+    stages.append(Stage('index', lambda: index_stage(night), ['setup']))
+    stages.append(Stage('checksum', lambda: checksum_stage(night), ['make_nightly_plots', 'skyprobe', 'get_dimm_data', 'index']))
+    stages.append(Stage('koaxfr', lambda: koaxfr_stage(night), ['checksum']))
+
+    return Pipeline(stages, log_writer=log_writer)
+
+
+def setup_stage(night):
+    '''
+    Creates the night directory, README and wx.LOC and the koawx entry
+    '''
+
+    wxDir = night['archiveDir']
+    utDate = night['utDate']
+    dbUpdate = night['dbUpdate']
+    log_writer = night['log_writer']
+
+    # Archive directory
+
+    if not os.path.exists(wxDir):
+        try:
+            os.makedirs(wxDir)
+        except:
+            log_writer.error('weather.py could not create {}'.format(wxDir))
+            raise
+
+    # koa.koawx entry
+
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=utdate&value=', utDate))
+        wxdb.updateWxDb(sendUrl, log_writer)
 
-# Archive directory
+    # No longer use all sky
 
-if not os.path.exists(wxDir):
-    try:
-        os.makedirs(wxDir)
-    except:
-        log_writer.error('weather.py could not create {}'.format(wxDir))
-        exit()
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=allsky&value=n/a'))
+        wxdb.updateWxDb(sendUrl, log_writer)
 
-# koa.koawx entry
+    # Add utdate to wxDir
 
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=utdate&value=', utDate))
-    wxdb.updateWxDb(sendUrl, log_writer)
+    wxDir = night['wxDir']
+    if not os.path.exists(wxDir):
+        try:
+            os.makedirs(wxDir)
+        except:
+            log_writer.error('weather.py could not create {}'.format(wxDir))
+            raise
 
-# No longer use all sky
+    log_writer.info('weather.py using directory {}'.format(wxDir))
+    log_writer.info('weather.py creating wx.LOC')
 
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=allsky&value=n/a'))
-    wxdb.updateWxDb(sendUrl, log_writer)
+    # Create README
 
-# Add utdate to wxDir
+    with open(wxDir+'/README', 'w') as fp:
+        fp.write(wxDir)
 
-joinSeq = (wxDir, '/', utDate.replace('-', ''))
-wxDir = ''.join(joinSeq)
-if not os.path.exists(wxDir):
-    try:
-        os.makedirs(wxDir)
-    except:
-        log_writer.error('weather.py could not create {}'.format(wxDir))
-        exit()
-
-log_writer.info('weather.py using directory {}'.format(wxDir))
-log_writer.info('weather.py creating wx.LOC')
-
-# Create README
-
-with open(wxDir+'/README', 'w') as fp:
-    fp.write(wxDir)
-
-# Create the LOC file
-
-joinSeq = (wxDir, '/wx.LOC')
-locFile = ''.join(joinSeq)
-joinSeq = ('Started, see ', logFile)
-line = ''.join(joinSeq)
-with open(locFile, 'w') as fp:
-    fp.write(line)
-
-# Call weather_nightly to create nightly# subdirectories
-# 20200515 - no longer copying all contents
-
-#log_writer.info('weather.py calling weather_nightly.py')
-#wn.weather_nightly(utDate, wxDir, dbUpdate, log_writer)
-os.makedirs(wxDir+'/nightly1')
-os.makedirs(wxDir+'/nightly2')
-if dbUpdate:
-    for i in range(1,3):
-        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=nightly', str(i), '&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
+    # Create the LOC file
+
+    joinSeq = ('Started, see ', night['logFile'])
+    line = ''.join(joinSeq)
+    with open(night['locFile'], 'w') as fp:
+        fp.write(line)
+
+    # Call weather_nightly to create nightly# subdirectories
+    # 20200515 - no longer copying all contents
+
+    #log_writer.info('weather.py calling weather_nightly.py')
+    #wn.weather_nightly(utDate, wxDir, dbUpdate, log_writer)
+    os.makedirs(wxDir+'/nightly1', exist_ok=True)
+    os.makedirs(wxDir+'/nightly2', exist_ok=True)
+    if dbUpdate:
+        for i in range(1,3):
+            sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=nightly', str(i), '&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
+            wxdb.updateWxDb(sendUrl, log_writer)
+
+
+def plots_stage(night):
+    '''
+    Calls make_nightly_plots to create weather and fwhm plots
+    '''
+
+    utDate = night['utDate']
+    log_writer = night['log_writer']
+
+    log_writer.info('weather.py calling make_nightly_plots.py')
+    mn.make_nightly_plots(utDate, night['wxDir'], log_writer, night['useCache'], night['writeText'])
+    if night['dbUpdate']:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=graphs&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
         wxdb.updateWxDb(sendUrl, log_writer)
 
-# Call make_nightly_plots to create weather and fwhm plots
 
-log_writer.info('weather.py calling make_nightly_plots.py')
-mn.make_nightly_plots(utDate, wxDir, log_writer)
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=graphs&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
-    wxdb.updateWxDb(sendUrl, log_writer)
+def skyprobe_stage(night):
+    '''
+    Gets the CFHT Skyprobe plot
+    '''
+
+    night['log_writer'].info('weather.py calling skyprobe.py')
+    sky.skyprobe(night['utDate'], night['wxDir'], night['log_writer'])
 
-# Get CFHT Skyprobe plot
 
-log_writer.info('weather.py calling skyprobe.py')
-sky.skyprobe(utDate, wxDir, log_writer)
+def dimm_stage(night):
+    '''
+    Gets the CFHT MASS/DIMM data and plots
+    '''
 
-# Get CFHT MASS/DIMM data and plots
+    night['log_writer'].info('weather.py calling get_dimm_data.py')
+    dimm.get_dimm_data(night['utDate'], night['wxDir'], night['log_writer'])
 
-log_writer.info('weather.py calling get_dimm_data.py')
-dimm.get_dimm_data(utDate, wxDir, log_writer)
 
+def seeing_index_stage(night):
+    '''
+    Adds the night's MASS/DIMM data to the seeing statistics index
+    '''
 
-# Read template html page
+    archiveDir = night['archiveDir']
+    index = seeing_index.SeeingIndex(seeing_index.get_index_dir(archiveDir))
+    index.update(archiveDir, [night['utDate']], night['log_writer'])
 
-lines = []
-utDate2 = utDate.replace('-', '')
-with open(dir_path+'/template.html', 'r') as fp:
-    l = fp.read().replace('YYYY-MM-DD', utDate)
-    l = l.replace('YYYYMMDD', utDate2)
-    lines.append(l)
 
-# Create the main html page
+def trend_store_stage(night):
+    '''
+    Adds the night's archiver files to the long-range trend store
+    '''
 
-log_writer.info('weather.py creating index.html')
+    archiveDir = night['archiveDir']
+    store = trend_store.TrendStore(trend_store.get_trend_dir(archiveDir))
+    store.update(archiveDir, [night['utDate']], night['log_writer'])
 
-joinSeq = (wxDir, '/index.html')
-file = ''.join(joinSeq)
-with open(file, 'w') as fp:
-    for l in lines:
-        fp.write(l)
 
-# Copy header files to release directory
-# There are copies of these files at NExScI already
-#copyfile(dir_path+'/header.css', wxDir+'/header.css')
-#copyfile(dir_path+'/header.js', wxDir+'/header.js')
+def index_stage(night):
+    '''
+    Creates index.html from the template
+    '''
 
-# All done, remove LOC file
+    utDate = night['utDate']
 
-log_writer.info('weather.py removing wx.LOC')
-os.remove(locFile)
+    # Read template html page
 
-# Walk through and create md5sum
+    lines = []
+    utDate2 = utDate.replace('-', '')
+    with open(dir_path+'/template.html', 'r') as fp:
+        l = fp.read().replace('YYYY-MM-DD', utDate)
+        l = l.replace('YYYYMMDD', utDate2)
+        lines.append(l)
 
-totalFiles = 0
-totalSize = 0
-joinSeq = (wxDir, '/weather', utDate.replace('-', ''), '.md5sum')
-md5sumFile = ''.join(joinSeq)
-with open(md5sumFile, 'w') as fp:
-    for root, dirs, files in os.walk(wxDir):
-        totalFiles += len(files)
-        for file in files:
-            if file in md5sumFile:
-                continue
-            joinSeq = (root, '/', file)
-            fullPath = ''.join(joinSeq)
-            md = hashlib.md5(open(fullPath, 'rb').read()).hexdigest()
-            joinSeq = (md, '  ', fullPath.replace(wxDir, '.'), '\n')
-            md = ''.join(joinSeq)
-            fp.write(md)
-            totalSize += os.path.getsize(fullPath) / 1000000.0
+    # Create the main html page
 
-# koa.koawx entry
+    night['log_writer'].info('weather.py creating index.html')
 
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=files&value=', str(totalFiles)))
-    wxdb.updateWxDb(sendUrl, log_writer)
+    joinSeq = (night['wxDir'], '/index.html')
+    file = ''.join(joinSeq)
+    with open(file, 'w') as fp:
+        for l in lines:
+            fp.write(l)
 
-totalSize = "{0:.3f}".format(totalSize)
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=size&value=', str(totalSize)))
-    wxdb.updateWxDb(sendUrl, log_writer)
+    # Copy header files to release directory
+    # There are copies of these files at NExScI already
+    #copyfile(dir_path+'/header.css', wxDir+'/header.css')
+    #copyfile(dir_path+'/header.js', wxDir+'/header.js')
 
-# Transfer data to NExScI
+    # Embeds the plots written by bokeh_plots.NightPlots
 
-if dbUpdate:
-    log_writer.info('weather.py transferring data to NExScI')
-    koaxfr.koaxfr(utDate, wxDir)
+    copyfile(dir_path+'/wx_plots.js', night['wxDir']+'/wx_plots.js')
 
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=data_sent&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
-    wxdb.updateWxDb(sendUrl, log_writer)
 
-if dbUpdate:
-    sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=wx_complete&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
-    wxdb.updateWxDb(sendUrl, log_writer)
+def checksum_stage(night):
+    '''
+    Removes wx.LOC, creates the md5sum file and updates files and size
+    '''
 
-log_writer.info('weather.py complete for {}'.format(utDate))
+    wxDir = night['wxDir']
+    utDate = night['utDate']
+    dbUpdate = night['dbUpdate']
+    log_writer = night['log_writer']
 
-# Send log contents
+    # All done, remove LOC file
 
-subject = ' '.join(('WEATHER',utDate))
-message = ''
-error = 0
-errorString = ''
-with open(logFile, 'r') as fp:
-    for line in fp:
-        if 'ERROR:' in line:
-            errorString = f'{errorString}{line}'
-            error += 1
-        message = ''.join((message, line))
+    log_writer.info('weather.py removing wx.LOC')
+    if os.path.exists(night['locFile']):
+        os.remove(night['locFile'])
 
-message = ''.join((str(error), ' errors\n\n', errorString, '\n\n', message))
-if message:
-    koaxfr.send_email(emailError, emailFrom, subject, message, log_writer)
+    # Walk through and create md5sum
+
+    # Manifest of the previous run is kept next to the log so reruns only
+    # rehash changed files
+
+    joinSeq = (wxDir, '/weather', utDate.replace('-', ''), '.md5sum')
+    md5sumFile = ''.join(joinSeq)
+    joinSeq = (night['archiveDir'], '/weather_', utDate.replace('-', ''), '.manifest')
+    manifestFile = ''.join(joinSeq)
+    totalFiles, totalSize = checksum.md5sum(wxDir, md5sumFile, manifestFile=manifestFile)
+
+    # koa.koawx entry
+
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=files&value=', str(totalFiles)))
+        wxdb.updateWxDb(sendUrl, log_writer)
 
+    totalSize = "{0:.3f}".format(totalSize)
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=size&value=', str(totalSize)))
+        wxdb.updateWxDb(sendUrl, log_writer)
+
+
+def koaxfr_stage(night):
+    '''
+    Transfers the data to NExScI
+    '''
+
+    wxDir = night['wxDir']
+    utDate = night['utDate']
+    dbUpdate = night['dbUpdate']
+    log_writer = night['log_writer']
+
+    # Transfer data to NExScI
+
+    if dbUpdate:
+        log_writer.info('weather.py transferring data to NExScI')
+        koaxfr.koaxfr(utDate, wxDir)
+
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=data_sent&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
+        wxdb.updateWxDb(sendUrl, log_writer)
+
+    if dbUpdate:
+        sendUrl = ''.join(('cmd=updateWxDb&utdate=', utDate, '&column=wx_complete&value=', datetime.utcnow().strftime('%Y%m%d+%H:%M:%S')))
+        wxdb.updateWxDb(sendUrl, log_writer)
+
+
+def main():
+    '''
+    Runs weather() for the command line arguments
+    '''
+
+    # Default UT date is today
+    # Runs at 2pm, so use now()
+
+    utDate = datetime.now().strftime('%Y-%m-%d')
+    dbUpdate = 1
+    useCache = True
+    writeText = True
+    stages = []
+
+    # Usage is wxDir, an optional UT date, then any of the flags
+
+    usage = 'Usage: weather.py wxDir [YYYY-MM-DD] [-nodb] [-nocache] [-notext] [-stage name]'
+    assert len(argv) >= 2, usage
+
+    # Parse UT date and flags from argument list
+
+    wxDir = argv[1]
+    args = argv[2:]
+    if args and not args[0].startswith('-'):
+        utDate = args.pop(0).replace('/', '-')
+    while args:
+        arg = args.pop(0)
+        if arg == '-nodb':
+            dbUpdate = 0
+        elif arg == '-nocache':
+            useCache = False
+        elif arg == '-notext':
+            writeText = False
+        elif arg == '-stage' and args:
+            stages.append(args.pop(0))
+        else:
+            assert False, 'Unknown argument {}\n{}'.format(arg, usage)
+
+    weather(wxDir, utDate, dbUpdate, useCache, stages=stages, writeText=writeText)
+
+
+if __name__ == '__main__':
+    main()
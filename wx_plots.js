@@ -0,0 +1,16 @@
+// Embeds the nightly plots written by bokeh_plots.NightPlots.  Each
+// plot fragment calls wxEmbed() and the document holding the plots
+// and their data is fetched once per page.
+
+var wxDocs = {};
+
+function wxEmbed(targetId, docUrl, name) {
+    if (!(docUrl in wxDocs)) {
+        wxDocs[docUrl] = fetch(docUrl).then(function(response) {
+            return response.json();
+        });
+    }
+    wxDocs[docUrl].then(function(payload) {
+        Bokeh.embed.embed_item({doc: payload.doc, root_id: payload.roots[name]}, targetId);
+    });
+}